@@ -0,0 +1,97 @@
+import numpy as np
+
+from revpy.lp_solve import _incidence_csr
+
+
+class BidPriceAvailability:
+    """Bid price control of product availability.
+
+    A product (trip, class) is open if its fare is at least the
+    displacement cost of the trip, i.e. the sum of the bid prices of the
+    legs the trip uses.
+
+    Parameters
+    ----------
+    A: 2D np array or scipy.sparse matrix
+            incidence matrix, size n_relations*n_legs
+    bid_prices: np array
+            bid price of each leg, e.g. from `lp_solve.solve_network_lp`
+    fares: 2D np array
+            optional fares, size n_classes*n_relations, used for queries
+            by class
+
+    Example
+    -------
+    >>> availability = BidPriceAvailability(A, bid_prices, fares)
+    >>> availability.is_open(trips=[0, 3], fares=[520, 110])
+    >>> availability.is_open(trips=[0, 3], classes=[1, 0])
+    >>> availability.update_bid_prices([450], legs=[1])
+    """
+
+    def __init__(self, A, bid_prices, fares=None):
+        A = _incidence_csr(A)
+
+        self.A = A
+        # column access for updates of single legs
+        self._A_csc = A.tocsc()
+        self.bid_prices = np.array(bid_prices, dtype=float)
+        self.displacement = A.dot(self.bid_prices)
+        self.fares = None if fares is None else np.asarray(fares,
+                                                           dtype=float)
+
+    def is_open(self, trips, classes=None, fares=None):
+        """Return whether the products are open.
+
+        Parameters
+        ----------
+        trips: np array of ints
+                relation indices
+        classes: np array of ints
+                class indices, only used if `fares` is not given
+        fares: np array
+                fares of the requested products, defaults to the fares of
+                the classes
+
+        Returns
+        -------
+        np array of bools, True for open products. Products with a null
+        fare are closed.
+        """
+        trips = np.asarray(trips)
+        if fares is None:
+            if classes is None or self.fares is None:
+                raise ValueError('Either fares or classes and fares at '
+                                 'construction are required')
+            fares = self.fares[np.asarray(classes), trips]
+
+        with np.errstate(invalid='ignore'):
+            return np.asarray(fares, dtype=float) >= self.displacement[trips]
+
+    def open_products(self):
+        """Return the availability of all products, a 2D np array of bools
+        of size n_classes*n_relations."""
+        if self.fares is None:
+            raise ValueError('Fares are required')
+        with np.errstate(invalid='ignore'):
+            return self.fares >= self.displacement
+
+    def update_bid_prices(self, bid_prices, legs=None):
+        """Update bid prices in place.
+
+        Parameters
+        ----------
+        bid_prices: np array
+                new bid prices of all legs, or of `legs` only
+        legs: np array of ints
+                unique indices of the legs to update, only the displacement
+                costs of the trips using them are recalculated
+        """
+        if legs is None:
+            self.bid_prices[:] = bid_prices
+            self.displacement[:] = self.A.dot(self.bid_prices)
+            return
+
+        legs = np.asarray(legs)
+        change = np.asarray(bid_prices, dtype=float) - self.bid_prices[legs]
+        self.bid_prices[legs] += change
+        self.displacement += self._A_csc[:, legs].dot(change)
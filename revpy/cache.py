@@ -0,0 +1,170 @@
+"""
+Opt-in memoization of fare transformation and EMSRb results.
+
+Identical fare ladders, demands and capacities occur frequently (e.g. on
+sibling departures or when iterating over remaining capacities). When
+enabled with `enable_cache`, results of the decorated functions are
+stored in a bounded LRU cache keyed by a content hash of the arguments.
+Cached arrays are returned read-only.
+"""
+
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict, namedtuple
+from functools import wraps
+
+import numpy as np
+
+from revpy.helpers import validation_enabled
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'entries', 'bytes',
+                                     'max_entries', 'max_bytes'])
+
+
+class ArrayCache:
+    """LRU cache for results consisting of np arrays.
+
+    Parameters
+    ----------
+    max_entries: int
+            maximum number of cached results
+    max_bytes: int
+            maximum total size of the cached arrays
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64*2**20):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return tuple (found, value) and mark `key` as recently used."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        """Store `value`, evicting the least recently used results if the
+        cache exceeds its limits."""
+        size = result_nbytes(value)
+        if size > self.max_bytes or self.max_entries < 1:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+            while (len(self._entries) > self.max_entries or
+                   self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def clear(self):
+        """Remove all cached results and reset statistics."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = 0
+
+    def info(self):
+        """Return hit/miss statistics and current size."""
+        return CacheInfo(self.hits, self.misses, len(self._entries),
+                         self._bytes, self.max_entries, self.max_bytes)
+
+
+_cache = None
+
+
+def enable_cache(max_entries=1024, max_bytes=64*2**20):
+    """Enable memoization with a new, empty cache and return it."""
+    global _cache
+    _cache = ArrayCache(max_entries, max_bytes)
+    return _cache
+
+
+def disable_cache():
+    """Disable memoization and drop the cache."""
+    global _cache
+    _cache = None
+
+
+def cache_info():
+    """Return statistics of the active cache, None if caching is
+    disabled."""
+    if _cache is None:
+        return None
+    return _cache.info()
+
+
+def memoize(func):
+    """Decorator that caches results of `func` while caching is enabled."""
+
+    signature = inspect.signature(func)
+    name = '{}.{}'.format(func.__module__, func.__qualname__)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        cache = _cache
+        if cache is None:
+            return func(*args, **kwargs)
+
+        arguments = signature.bind(*args, **kwargs)
+        arguments.apply_defaults()
+        # results computed without validation of the inputs, see
+        # `helpers.trusted_input`, are not returned to validating calls
+        key = (name, validation_enabled()) + tuple(
+            argument_key(value) for value in arguments.arguments.values())
+
+        found, result = cache.get(key)
+        if not found:
+            result = read_only(func(*args, **kwargs))
+            cache.put(key, result)
+
+        return result
+
+    return wrapper
+
+
+def argument_key(value):
+    """Hashable key of a function argument, arrays are represented by a
+    hash of their content."""
+    if isinstance(value, np.ndarray):
+        content = np.ascontiguousarray(value)
+        digest = hashlib.blake2b(content.reshape(-1).view(np.uint8),
+                                 digest_size=16).digest()
+        return value.dtype.str, value.shape, digest
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__, tuple(argument_key(v) for v in value)
+    return value
+
+
+def read_only(result):
+    """Copy arrays in `result` and make them read-only."""
+    if isinstance(result, np.ndarray):
+        result = result.copy()
+        result.setflags(write=False)
+        return result
+    if isinstance(result, tuple):
+        return tuple(read_only(r) for r in result)
+    return result
+
+
+def result_nbytes(result):
+    """Total size of the arrays in `result`."""
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, tuple):
+        return sum(result_nbytes(r) for r in result)
+    return 0
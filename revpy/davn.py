@@ -0,0 +1,170 @@
+"""
+Displacement adjusted virtual nesting (DAVN).
+
+The fare of a product is adjusted on each of its legs by the displacement
+cost of the other legs it uses, i.e. their bid prices from the network LP.
+Each leg is then optimized on its own with EMSRb, the virtual classes of a
+leg being its products (or fare buckets) ordered by adjusted fare (see
+Talluri and van Ryzin, section 3.4.3).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from revpy.lp_solve import capacity_matrix, solve_network_lp
+from revpy.revpy import booking_limits_batch
+
+
+DAVNResult = namedtuple('DAVNResult', ['booking_limits', 'fares', 'demands',
+                                       'legs', 'products', 'virtual_classes',
+                                       'bid_prices'])
+
+
+def davn_booking_limits(fares, demands, capacities, A, bid_prices=None,
+                        sigmas=None, buckets=None, method='EMSRb',
+                        backend='auto'):
+    """Calculate booking limits of all legs with DAVN.
+
+    Parameters
+    ----------
+    fares: 2D np array
+            fares of the products, size n_classes*n_relations
+    demands: 2D np array
+            demands of the products
+    capacities: np array
+            capacity of each leg
+    A: 2D np array or scipy.sparse matrix
+            incidence matrix, size n_relations*n_legs
+    bid_prices: np array
+            bid price of each leg, by default calculated with
+            `lp_solve.solve_network_lp`
+    sigmas: 2D np array
+            standard deviations of the demands, if not given the demands
+            are deterministic
+    buckets: np array
+            increasing lower bounds of fare buckets shared by all legs.
+            If given, the virtual classes of a leg are the buckets with
+            the summed demands of the products whose adjusted fares fall
+            into them, otherwise each product is a virtual class.
+    method: str
+            optimization method ('EMSRb' or 'EMSRb_MR')
+    backend: str
+            LP backend used to calculate the bid prices, see
+            `lp_solve.solve_network_lp`
+
+    Returns
+    -------
+    DAVNResult
+            booking_limits: incremental booking limits of the virtual
+            classes, size n_legs*n_virtual_classes, zero for padding
+            fares, demands: adjusted fares and demands of the virtual
+            classes in decreasing order of fares, NaN for padding
+            legs, products, virtual_classes: for each product on each
+            leg, the leg, the product (index into the flattened fares)
+            and the virtual class on the leg (column of `booking_limits`),
+            -1 for products closed on the leg as their adjusted fare is
+            not positive
+            bid_prices: bid prices used to adjust the fares
+    """
+    fares = np.array(fares, dtype=float)
+    demands = np.array(demands, dtype=float)
+    capacities = np.asarray(capacities, dtype=float)
+    n_classes = fares.shape[0]
+    n_legs = len(capacities)
+
+    if bid_prices is None:
+        A_copy = A.copy() if sp.issparse(A) else np.array(A, dtype=float)
+        bid_prices = solve_network_lp(fares.copy(), demands.copy(),
+                                      capacities, A_copy,
+                                      backend=backend)[1]
+    bid_prices = np.asarray(bid_prices, dtype=float)
+
+    demands[pd.isnull(demands)] = 0
+    f, d = fares.ravel(), demands.ravel()
+    s = None if sigmas is None else np.nan_to_num(
+        np.asarray(sigmas, dtype=float)).ravel()
+
+    # adjusted fare of each product on each of its legs
+    M = capacity_matrix(A, n_classes).tocoo()
+    legs, products = M.row, M.col
+    displacement = M.T.dot(bid_prices)
+    with np.errstate(invalid='ignore'):
+        adjusted_fares = f[products] - displacement[products] + \
+            M.data * bid_prices[legs]
+        is_open = adjusted_fares > 0
+
+    if buckets is None:
+        virtual = _product_classes(legs[is_open], adjusted_fares[is_open],
+                                   n_legs)
+        n_virtual = max(1, virtual.max() + 1 if len(virtual) else 0)
+    else:
+        buckets = np.asarray(buckets, dtype=float)
+        virtual = _bucket_classes(adjusted_fares[is_open], buckets)
+        n_virtual = len(buckets)
+    virtual_classes = np.full(len(legs), -1)
+    virtual_classes[is_open] = virtual
+
+    # fares, demands and sigmas of the virtual classes
+    shape = (n_legs, n_virtual)
+    leg_classes = (legs[is_open], virtual)
+    open_products = products[is_open]
+    # each product is a virtual class padded with NaN, all legs have
+    # all buckets
+    padding = np.nan if buckets is None else 0
+
+    class_demands = _sums(leg_classes, d[open_products], shape, padding)
+    if buckets is None:
+        class_fares = np.full(shape, np.nan)
+        class_fares[leg_classes] = adjusted_fares[is_open]
+    else:
+        revenues = _sums(leg_classes,
+                         adjusted_fares[is_open] * d[open_products], shape)
+        # empty buckets get their lower bound, keeping fares decreasing
+        with np.errstate(invalid='ignore', divide='ignore'):
+            class_fares = np.where(class_demands > 0,
+                                   revenues / class_demands, buckets[::-1])
+
+    class_sigmas = None
+    if s is not None:
+        class_sigmas = np.sqrt(_sums(leg_classes, s[open_products] ** 2,
+                                     shape, padding))
+
+    limits = booking_limits_batch(class_fares, class_demands, capacities,
+                                  class_sigmas, method)
+
+    return DAVNResult(limits, class_fares, class_demands, legs, products,
+                      virtual_classes, bid_prices)
+
+
+def _product_classes(legs, adjusted_fares, n_legs):
+    """Return the virtual class of each product on a leg when each product
+    is a virtual class, ordered by decreasing adjusted fare."""
+    order = np.lexsort((-adjusted_fares, legs))
+    starts = np.searchsorted(legs[order], np.arange(n_legs))
+
+    virtual = np.empty(len(legs), dtype=int)
+    virtual[order] = np.arange(len(legs)) - starts[legs[order]]
+    return virtual
+
+
+def _bucket_classes(adjusted_fares, buckets):
+    """Return the virtual class of each product on a leg, i.e. its fare
+    bucket counted from the highest one. Products below the lowest
+    bucket fall into the lowest."""
+    bucket = np.searchsorted(buckets, adjusted_fares, side='right') - 1
+    return len(buckets) - 1 - np.maximum(bucket, 0)
+
+
+def _sums(index, values, shape, padding=0):
+    """Sum `values` into a 2D array at `index`, `padding` where nothing is
+    summed."""
+    sums = np.zeros(shape)
+    np.add.at(sums, index, values)
+    if padding != 0:
+        counts = np.zeros(shape, dtype=int)
+        np.add.at(counts, index, 1)
+        sums[counts == 0] = padding
+    return sums
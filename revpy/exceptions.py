@@ -1,3 +1,25 @@
 
 class InvalidInputParameters(Exception):
     pass
+
+
+class InvalidFares(ValueError):
+    """Fares of some rows of a batch are not in decreasing order, their
+    indices are stored in `rows`."""
+
+    def __init__(self, message, rows):
+        super().__init__(message)
+        self.rows = rows
+
+
+class LPSolveError(Exception):
+    """The LP solver did not find an optimal solution, the status code of
+    the solver (see `lp_solve.LP_STATUS`) is stored in `status`."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+    def __reduce__(self):
+        # keep `status` when raised in a worker process
+        return self.__class__, (self.args[0], self.status)
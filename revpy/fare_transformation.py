@@ -7,14 +7,20 @@ Notation of variable names partly follow this paper.
 """
 
 
+from functools import wraps
+
 import numpy as np
 
-from revpy.helpers import check_fares_decreasing, fill_nan
+from revpy.cache import memoize
+from revpy.helpers import check_fares_decreasing, \
+    check_fares_decreasing_batch, compress_rows, fill_nan, fill_nan_rows
 
 
+@memoize
 def calc_fare_transformation(fares, demands, cap=None,
                              fare_structure='undifferentiated',
-                             return_all=False):
+                             return_all=False, fill_inefficient=True,
+                             validate=True):
 
     """Transform fares and demands to adjusted fares and adjusted demands.
 
@@ -29,6 +35,11 @@ def calc_fare_transformation(fares, demands, cap=None,
            only 'undifferentiated' is supported at the moment
     return_all: bool
            when True, return `Q` and `TR`
+    fill_inefficient: bool
+           when False, return values for efficient strategies only,
+           followed by their indices
+    validate: bool
+           when False, skip checking that fares are decreasing
 
     Returns
     -------
@@ -38,13 +49,17 @@ def calc_fare_transformation(fares, demands, cap=None,
            cumulative demands of efficient strategies
     TR_eff: np array
            total revenues of efficient strategies
+    eff_indices: np array
+           indices of efficient strategies, only returned when
+           `fill_inefficient` is False
     """
 
     if fare_structure != 'undifferentiated':
         raise ValueError('dare structure "{}" not supported'
                          ''.format(fare_structure))
 
-    check_fares_decreasing(fares)
+    if validate:
+        check_fares_decreasing(fares)
 
     # cumulative demand
     Q = demands.cumsum()
@@ -60,6 +75,13 @@ def calc_fare_transformation(fares, demands, cap=None,
     adjusted_fares_temp, adjusted_demand_temp, Q_eff_temp, \
         TR_eff_temp, eff_indices = efficient_strategies(Q, TR, fares[0])
 
+    if not fill_inefficient:
+        if not return_all:
+            return adjusted_fares_temp, adjusted_demand_temp, eff_indices
+        else:
+            return adjusted_fares_temp, adjusted_demand_temp, Q_eff_temp, \
+                TR_eff_temp, eff_indices
+
     # ensure that adjusted fares and demands have the same shape as `fares` by
     # filling indices corresponding to inefficient strategies with NaNs.
     size = fares.shape
@@ -76,8 +98,98 @@ def calc_fare_transformation(fares, demands, cap=None,
         return adjusted_fares, adjusted_demand, Q_eff, TR_eff
 
 
+def calc_fare_transformation_batch(fares, demands, cap=None,
+                                   fare_structure='undifferentiated',
+                                   return_all=False, validate=True):
+    """Transform fares and demands of several markets at once.
+
+    Parameters
+    ----------
+    fares: 2D np array
+           fares, size n_markets*n_classes, each row provided in
+           decreasing order. Markets with less classes are padded with
+           trailing NaN fares.
+    demands: 2D np array
+           demands for the fares in `fares`
+    cap: np array
+           capacity of each market
+    fare_structure: str
+           only 'undifferentiated' is supported at the moment
+    return_all: bool
+           when True, return `Q` and `TR`
+    validate: bool
+           when False, skip checking that fares are decreasing
+
+    Returns
+    -------
+    adjusted_fares: 2D np array
+    adjusted_demand: 2D np array
+    Q_eff: 2D np array
+           cumulative demands of efficient strategies
+    TR_eff: 2D np array
+           total revenues of efficient strategies
+
+    Each row equals the result of `calc_fare_transformation` for the
+    corresponding market, inefficient strategies and padded classes are
+    NaN.
+    """
+
+    if fare_structure != 'undifferentiated':
+        raise ValueError('dare structure "{}" not supported'
+                         ''.format(fare_structure))
+
+    if validate:
+        check_fares_decreasing_batch(fares)
+
+    # cumulative demand
+    Q = demands.cumsum(axis=1)
+
+    # shrink Q when it exceeds capacity
+    if cap is not None:
+        cap = np.broadcast_to(cap, fares.shape[:1])[:, None]
+        Q = np.where(Q > cap, cap, Q)
+
+    # total revenue
+    TR = fares*Q
+
+    efficient = efficient_strategies_mask(Q, TR) & ~np.isnan(fares)
+
+    # cumulative demand and total revenue of the preceding efficient
+    # strategy
+    n_markets, n_classes = fares.shape
+    positions = np.where(efficient, np.arange(n_classes), -1)
+    positions = np.maximum.accumulate(positions, axis=1)[:, :-1]
+    Q_prev = np.take_along_axis(Q, positions, axis=1)
+    TR_prev = np.take_along_axis(TR, positions, axis=1)
+    Q_prev[positions < 0] = 0
+    TR_prev[positions < 0] = 0
+
+    adjusted_demand = Q - np.hstack((np.zeros((n_markets, 1)), Q_prev))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        adjusted_fares = (TR - np.hstack((np.zeros((n_markets, 1)),
+                                          TR_prev))) / adjusted_demand
+
+    # class 1 adjusted fare is always the original fare, see
+    # `efficient_strategies`
+    first_undefined = (adjusted_demand[:, 0] == 0) | \
+        np.isnan(adjusted_demand[:, 0])
+    adjusted_fares[first_undefined, 0] = fares[first_undefined, 0]
+
+    adjusted_fares[~efficient] = np.nan
+    adjusted_demand[~efficient] = np.nan
+
+    if not return_all:
+
+        return adjusted_fares, adjusted_demand
+    else:
+        Q_eff = np.where(efficient, Q, np.nan)
+        TR_eff = np.where(efficient, TR, np.nan)
+
+        return adjusted_fares, adjusted_demand, Q_eff, TR_eff
+
+
 def efficient_strategies(Q, TR, highest_fare, indices=None):
-    """Recursively removing all inefficient strategies.
+    """Remove all inefficient strategies.
 
     For fare transformation, all inefficient strategies have to be
     removed. Inefficient strategies have a negative marginal revenue
@@ -92,7 +204,8 @@ def efficient_strategies(Q, TR, highest_fare, indices=None):
         total revenues
     highest_fare: float, most expensive fare
     indices: np array
-        efficient indices, must be initially set to None, used in recursion
+        original indices of the strategies in `Q` and `TR`, defaults to
+        0, 1, ..., len(Q) - 1
 
     Returns
     -------
@@ -104,8 +217,17 @@ def efficient_strategies(Q, TR, highest_fare, indices=None):
         strategies
     """
 
+    if indices is None:
+        indices = np.arange(0, len(Q))
+
+    efficient = efficient_strategies_mask(Q, TR)
+    Q = Q[efficient]
+    TR = TR[efficient]
+    indices = indices[efficient]
+
     adjusted_demand = Q - np.hstack((0, Q[:-1]))
-    adjusted_fares = (TR - np.hstack((0, TR[:-1]))) / adjusted_demand
+    with np.errstate(divide='ignore', invalid='ignore'):
+        adjusted_fares = (TR - np.hstack((0, TR[:-1]))) / adjusted_demand
 
     # class 1 (most expensive class) adjusted fare should always be the
     # original fare (and should correspond to an efficient strategy),
@@ -114,37 +236,51 @@ def efficient_strategies(Q, TR, highest_fare, indices=None):
     if adjusted_demand[0] == 0 or np.isnan(adjusted_demand[0]):
         adjusted_fares[0] = highest_fare
 
-    # if subsequent classes have zero demand, mark the strategies as
-    # inefficient
-    adjusted_fares[np.isnan(adjusted_fares)] = -1
+    return adjusted_fares, adjusted_demand, Q, TR, indices
 
-    # initialize indices
-    if indices is None:
-        indices = np.arange(0, len(Q))
 
-    # base case
-    if all(adjusted_fares >= 0):
+def efficient_strategies_mask(Q, TR):
+    """Mark efficient strategies along the last axis of `Q` and `TR` in a
+    single pass.
 
-        return adjusted_fares, adjusted_demand, Q, TR, indices
-    # recursively remove inefficient strategies
-    else:
-        inefficient = adjusted_fares < 0
-        Q = Q[~inefficient]
-        TR = TR[~inefficient]
-        indices = indices[~inefficient]
+    A strategy has a non-negative marginal revenue with respect to the
+    preceding efficient strategy if its total revenue is at least as
+    large as the total revenue of all preceding strategies, and its
+    cumulative demand exceeds the one of the preceding such strategy.
+    Strategies with NaN cumulative demand are inefficient. The most
+    expensive class is always efficient.
+    """
+
+    # total revenue of the preceding strategies
+    TR_max = np.maximum.accumulate(TR, axis=-1)
+    TR_max_prev = np.concatenate((np.full(TR.shape[:-1] + (1,), -np.inf),
+                                  TR_max[..., :-1]), axis=-1)
+    with np.errstate(invalid='ignore'):
+        candidates = TR >= TR_max_prev
+    candidates[..., 0] = True
+
+    # cumulative demand of the preceding candidate
+    positions = np.where(candidates, np.arange(Q.shape[-1]), 0)
+    positions = np.maximum.accumulate(positions, axis=-1)
+    Q_prev = np.take_along_axis(Q, positions[..., :-1], axis=-1)
+
+    efficient = candidates
+    with np.errstate(invalid='ignore'):
+        efficient[..., 1:] &= Q[..., 1:] > Q_prev
 
-        return efficient_strategies(Q, TR, highest_fare, indices)
+    return efficient
 
 
 def fare_trafo_decorator(optimizer):
     """Decorator that wraps the fare trafo around an optimizer."""
 
-    def wrapper(fares, demands, sigmas=None, cap=None):
+    def wrapper(fares, demands, sigmas=None, cap=None, validate=True):
         if sigmas is None:
             sigmas = np.zeros(fares.shape)
 
         adjusted_fares, adjusted_demand = \
-            calc_fare_transformation(fares, demands, cap=cap)
+            calc_fare_transformation(fares, demands, cap=cap,
+                                     validate=validate)
 
         # inefficient strategies correspond NaN adjusted fares
         efficient_indices = np.where(~np.isnan(adjusted_fares))[0]
@@ -165,3 +301,30 @@ def fare_trafo_decorator(optimizer):
         return protection_levels
 
     return wrapper
+
+
+def batch_fare_trafo_decorator(optimizer):
+    """Decorator that wraps the batched fare trafo around an optimizer for
+    several markets (see `calc_EMSRb_batch` for the expected signature).
+    """
+
+    @wraps(optimizer)
+    def wrapper(fares, demands, sigmas=None, cap=None, validate=True):
+        if sigmas is None:
+            sigmas = np.zeros(fares.shape)
+
+        adjusted_fares, adjusted_demand = \
+            calc_fare_transformation_batch(fares, demands, cap=cap,
+                                           validate=validate)
+
+        # calculate protection levels with `optimizer` using efficient
+        # strategies only, which are moved to the front of each row
+        efficient = ~np.isnan(adjusted_fares)
+        protection_levels_temp = optimizer(
+            compress_rows(adjusted_fares, efficient),
+            compress_rows(adjusted_demand, efficient),
+            compress_rows(sigmas, efficient))
+
+        return fill_nan_rows(efficient, protection_levels_temp)
+
+    return wrapper
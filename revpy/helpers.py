@@ -1,9 +1,18 @@
+import threading
+from contextlib import contextmanager
+
 import numpy as np
 
+from revpy.exceptions import InvalidFares
+
+
+_validation = threading.local()
+
 
 def is_decreasing(array):
 
-    return all(x >= y for x, y in zip(array, array[1:]))
+    array = np.asarray(array)
+    return bool(np.all(array[:-1] >= array[1:]))
 
 
 def is_increasing(array):
@@ -11,11 +20,54 @@ def is_increasing(array):
     return is_decreasing(array[::-1])
 
 
+@contextmanager
+def trusted_input():
+    """Context manager that skips validation of fares, e.g. for inputs
+    that have been validated once with `check_fares_decreasing_batch`.
+    """
+    enabled = validation_enabled()
+    _validation.enabled = False
+    try:
+        yield
+    finally:
+        _validation.enabled = enabled
+
+
+def validation_enabled():
+    """Return False within a `trusted_input` context."""
+    return getattr(_validation, 'enabled', True)
+
+
 def check_fares_decreasing(fares):
-    if not is_decreasing(fares):
+    if validation_enabled() and not is_decreasing(fares):
         raise ValueError('fares must be provided in decreasing order')
 
 
+def invalid_fare_rows(fares):
+    """Return indices of the rows of `fares` that are not decreasing or
+    whose NaN padding is not at the end of the row."""
+    padded = np.isnan(fares)
+    with np.errstate(invalid='ignore'):
+        invalid = np.any(fares[:, :-1] < fares[:, 1:], axis=1)
+    invalid |= np.any(padded[:, :-1] & ~padded[:, 1:], axis=1)
+
+    return np.where(invalid)[0]
+
+
+def check_fares_decreasing_batch(fares):
+    """Check that each row of `fares` is decreasing, ignoring trailing
+    NaN padding. All invalid rows are reported in the raised exception.
+    """
+    if not validation_enabled():
+        return
+
+    rows = invalid_fare_rows(fares)
+    if len(rows):
+        raise InvalidFares('fares must be provided in decreasing order, '
+                           'padded with trailing NaNs (rows {})'
+                           ''.format(rows.tolist()), rows)
+
+
 def fill_nan(array_size, indices, values):
     """
     Return array of size `array_size`, that contains values `values` at
@@ -27,6 +79,58 @@ def fill_nan(array_size, indices, values):
     return out
 
 
+def fill_nan_rows(mask, values):
+    """2D counterpart of `fill_nan`.
+
+    Return array of shape `mask.shape`, that contains the left-aligned
+    values of each row of `values` at the positions where `mask` is True
+    and nan everywhere else.
+    """
+    out = np.full(mask.shape, np.nan)
+    n_values = mask.sum(axis=1)
+    out[mask] = values[np.arange(mask.shape[1]) < n_values[:, None]]
+
+    return out
+
+
+def compress_rows(array, mask):
+    """Inverse of `fill_nan_rows`.
+
+    Move the elements of each row of `array` where `mask` is True to the
+    front of the row and pad the rest of the row with nan.
+    """
+    out = np.full(mask.shape, np.nan)
+    n_values = mask.sum(axis=1)
+    out[np.arange(mask.shape[1]) < n_values[:, None]] = array[mask]
+
+    return out
+
+
+def segment_sums(values, offsets):
+    """Sum `values` over the segments values[offsets[i]:offsets[i + 1]].
+
+    `offsets` are non-decreasing and end with len(values). Empty segments
+    sum to zero, unlike with `np.add.reduceat`.
+    """
+    offsets = np.asarray(offsets)
+    starts = offsets[:-1]
+    non_empty = starts < offsets[1:]
+
+    sums = np.zeros(len(starts))
+    if non_empty.any():
+        # empty segments add no elements up to the next non-empty start
+        sums[non_empty] = np.add.reduceat(np.asarray(values, dtype=float),
+                                          starts[non_empty])
+    return sums
+
+
+def segment_ids(offsets):
+    """Return the segment of each element for segments defined by
+    `offsets` (see `segment_sums`)."""
+    offsets = np.asarray(offsets)
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
 def cumulative_booking_limits(protection_levels, capacity):
     """Convert protection level into cumulative booking limits."""
 
@@ -56,3 +160,60 @@ def incremental_booking_limits(cum_book_lim):
     incremental_limits[notnull] = incremental_limits_notnull
 
     return incremental_limits
+
+
+def cumulative_booking_limits_batch(protection_levels, capacities,
+                                    mask=None):
+    """Convert protection levels of several flights into cumulative booking
+    limits, row by row as done by `cumulative_booking_limits`.
+
+    Parameters
+    ----------
+    protection_levels: 2D np array
+           protection levels, size n_flights*n_classes
+    capacities: np array
+           capacity of each flight
+    mask: 2D np array of bools
+           False for padded classes that do not exist on a flight, these
+           get nan booking limits. By default all classes exist.
+    """
+    if mask is None:
+        mask = np.ones(protection_levels.shape, dtype=bool)
+    capacities = np.broadcast_to(capacities, protection_levels.shape[:1])
+
+    book_lim = capacities[:, None] - protection_levels
+    book_lim[book_lim < 0] = 0
+
+    # if all protection levels of a flight are zero, protect everything for
+    # lowest class
+    all_zero = np.all((protection_levels == 0) | ~mask, axis=1)
+    book_lim[all_zero] = 0
+    book_lim[all_zero, 0] = capacities[all_zero]
+    book_lim[~mask] = np.nan
+
+    return book_lim
+
+
+def incremental_booking_limits_batch(cum_book_lim):
+    """Convert cumulative booking limits of several flights to incremental
+    booking limits, row by row as done by `incremental_booking_limits`.
+    """
+
+    n_flights, n_classes = cum_book_lim.shape
+    notnull = ~np.isnan(cum_book_lim)
+
+    # for each class, find the next class with not null booking limit (or
+    # the sentinel column `n_classes` holding a zero booking limit)
+    positions = np.where(notnull, np.arange(n_classes), n_classes)
+    next_positions = np.hstack((positions[:, 1:],
+                                np.full((n_flights, 1), n_classes)))
+    next_positions = np.minimum.accumulate(next_positions[:, ::-1],
+                                           axis=1)[:, ::-1]
+
+    book_lim = np.hstack((cum_book_lim, np.zeros((n_flights, 1))))
+    next_book_lim = np.take_along_axis(book_lim, next_positions, axis=1)
+
+    incremental_limits = np.zeros(cum_book_lim.shape)
+    incremental_limits[notnull] = (cum_book_lim - next_book_lim)[notnull]
+
+    return incremental_limits
@@ -0,0 +1,210 @@
+"""
+On-disk cache of compiled network LP structures.
+
+The capacity constraint matrix and the names of a network LP only depend
+on the network topology, which rarely changes between runs. An
+`LPStructureCache` stores them in a directory keyed by a hash of the
+incidence matrix and the names, so that fresh processes can memory-map
+the matrix and only need to set fares, demands and capacities:
+
+>>> cache = LPStructureCache('/var/cache/revpy')
+>>> model = cache.network_lp(A, n_classes=2)
+>>> model.update(fares, demands, capacities)
+>>> allocations, bid_prices, optimal_revenue = model.solve()
+
+Each structure is stored in its own sub-directory, the matrix as .npy
+files and the names as JSON. When the directory grows beyond `max_bytes`,
+the least recently used structures are removed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import uuid
+
+import numpy as np
+import scipy.sparse as sp
+
+from revpy.lp_solve import LPStructure, NetworkLP, compile_network_lp
+
+
+# bump when the stored format changes
+FORMAT_VERSION = 1
+
+# names of entries, see `structure_key`, and of entries being stored
+_ENTRY = re.compile(r'[0-9a-f]{40}')
+_TMP_ENTRY = re.compile(r'[0-9a-f]{40}\.tmp-[0-9a-f]{32}')
+
+
+class LPStructureCache:
+    """Directory of compiled network LP structures.
+
+    Parameters
+    ----------
+    directory: str
+            cache directory, created if it does not exist
+    max_bytes: int
+            maximum total size of the cached structures
+    mmap: bool
+            memory-map the cached matrices instead of reading them
+    """
+
+    def __init__(self, directory, max_bytes=2**30, mmap=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        os.makedirs(directory, exist_ok=True)
+
+    def network_lp(self, A, n_classes, class_names=None, trip_names=None,
+                   leg_names=None, products=None, legs=None):
+        """Return a `NetworkLP` built from the cached structure, see
+        `NetworkLP` for the parameters."""
+        structure = self.get(A, n_classes, class_names, trip_names,
+                             leg_names)
+        return NetworkLP.from_structure(structure, products, legs)
+
+    def get(self, A, n_classes, class_names=None, trip_names=None,
+            leg_names=None):
+        """Return the structure of the network LP, compiling and storing
+        it if it is not cached yet.
+
+        Returns
+        -------
+        LPStructure
+        """
+        key = structure_key(A, n_classes, class_names, trip_names, leg_names)
+
+        structure = self.load(key)
+        if structure is None:
+            structure = compile_network_lp(A, n_classes, class_names,
+                                           trip_names, leg_names)
+            self.store(key, structure)
+            self.evict()
+        else:
+            # names given by the caller keep their types, the cached ones
+            # are strings
+            structure = structure._replace(
+                class_names=_given(class_names, structure.class_names),
+                trip_names=_given(trip_names, structure.trip_names),
+                leg_names=_given(leg_names, structure.leg_names))
+
+        return structure
+
+    def load(self, key):
+        """Return the structure stored under `key`, None if there is
+        none."""
+        path = os.path.join(self.directory, key)
+        try:
+            with open(os.path.join(path, 'names.json')) as f:
+                names = json.load(f)
+
+            mmap_mode = 'r' if self.mmap else None
+            data, indices, indptr = (
+                np.load(os.path.join(path, name + '.npy'),
+                        mmap_mode=mmap_mode)
+                for name in ['data', 'indices', 'indptr'])
+            os.utime(path)
+        except FileNotFoundError:
+            # not cached or evicted by another process
+            return None
+
+        matrix = sp.csr_matrix((data, indices, indptr),
+                               shape=tuple(names['shape']), copy=False)
+
+        return LPStructure(matrix, names['class_names'], names['trip_names'],
+                           names['leg_names'], names['product_names'])
+
+    def store(self, key, structure):
+        """Store `structure` under `key`.
+
+        The files are written to a temporary directory which is renamed
+        afterwards, so concurrent processes never see partial entries.
+        """
+        path = os.path.join(self.directory, key)
+        tmp_path = '{}.tmp-{}'.format(path, uuid.uuid4().hex)
+        os.makedirs(tmp_path)
+
+        matrix = structure.matrix
+        for name in ['data', 'indices', 'indptr']:
+            np.save(os.path.join(tmp_path, name + '.npy'),
+                    getattr(matrix, name))
+
+        names = {'shape': matrix.shape,
+                 'class_names': [str(n) for n in structure.class_names],
+                 'trip_names': [str(n) for n in structure.trip_names],
+                 'leg_names': [str(n) for n in structure.leg_names],
+                 'product_names': structure.product_names}
+        with open(os.path.join(tmp_path, 'names.json'), 'w') as f:
+            json.dump(names, f)
+
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # stored concurrently by another process
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def evict(self):
+        """Remove the least recently used structures until the cache is
+        not larger than `max_bytes`. Other files and directories in the
+        cache directory are left alone."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir() or not _ENTRY.fullmatch(entry.name):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in os.scandir(entry.path))
+                entries.append((entry.stat().st_mtime, size, entry.path))
+            except FileNotFoundError:
+                continue
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        """Remove all cached structures, including leftovers of
+        interrupted stores."""
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and (_ENTRY.fullmatch(entry.name) or
+                                   _TMP_ENTRY.fullmatch(entry.name)):
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def structure_key(A, n_classes, class_names=None, trip_names=None,
+                  leg_names=None):
+    """Return a hash of the incidence matrix and the names identifying
+    the structure of a network LP."""
+    h = hashlib.blake2b(digest_size=20)
+
+    meta = [FORMAT_VERSION, n_classes, A.shape]
+    for names in [class_names, trip_names, leg_names]:
+        meta.append(None if names is None else [str(n) for n in names])
+    h.update(json.dumps(meta).encode())
+
+    if sp.issparse(A):
+        # equal matrices with duplicate entries or unsorted indices get
+        # the same key
+        A = sp.csr_matrix(A, copy=True)
+        A.sum_duplicates()
+        A.sort_indices()
+        h.update(b'csr')
+        arrays = [A.data, A.indices, A.indptr]
+    else:
+        h.update(b'dense')
+        arrays = [np.asarray(A)]
+
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        h.update(array.dtype.str.encode())
+        h.update(array.reshape(-1).view(np.uint8))
+
+    return h.hexdigest()
+
+
+def _given(names, cached_names):
+    return cached_names if names is None else names
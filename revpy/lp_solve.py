@@ -1,12 +1,48 @@
 import numpy as np
 import pandas as pd
 import pulp
+import scipy.sparse as sp
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse.csgraph import connected_components
+from collections import namedtuple
 from itertools import product
-from functools import wraps
+from functools import partial, wraps
+
+from scipy.optimize import linprog
+
+from revpy.exceptions import LPSolveError
+
+
+PresolveStats = namedtuple('PresolveStats', ['n_products',
+                                             'n_products_removed',
+                                             'n_legs', 'n_legs_removed'])
+
+
+# status codes reported by all LP backends
+LP_STATUS = ('optimal', 'infeasible', 'unbounded', 'limit_reached',
+             'not_solved', 'numerical_error', 'undefined')
+
+# problems with more non-zeros in the capacity constraints are solved with
+# an interior point method when the backend is chosen automatically
+AUTO_IPM_MIN_NONZEROS = 500000
+
+LPSolution = namedtuple('LPSolution', ['x', 'duals', 'objective', 'status'])
+
+BidPriceScenarios = namedtuple('BidPriceScenarios', ['mean', 'quantiles',
+                                                     'bid_prices',
+                                                     'revenues'])
+
+BidPriceTable = namedtuple('BidPriceTable', ['capacities', 'bid_prices'])
+
+LPStructure = namedtuple('LPStructure', ['matrix', 'class_names',
+                                         'trip_names', 'leg_names',
+                                         'product_names'])
 
 
 def solve_network_lp(fares, demands, capacities, A, class_names=None,
-                     trip_names=None, leg_names=None):
+                     trip_names=None, leg_names=None, presolve=False,
+                     backend='auto', threads=None, time_limit=None,
+                     structure_cache=None):
     """Solve a network LP.
 
     Parameters
@@ -17,11 +53,29 @@ def solve_network_lp(fares, demands, capacities, A, class_names=None,
             contains demands for products, size n_classes*n_products
     capacities: list or iterable of numbers
             contains the capacities on the segments/legs
-    A: 2D np array
+    A: 2D np array or scipy.sparse matrix
             "incidence matrix", size n_relations*n_segments
              a_ij is 1 when relation i uses segment j and 0 otherwise
     class_names, trip_names, leg_names: lists
             contain optional names
+    presolve: bool
+            when True, remove products and legs that do not affect the
+            solution before building the LP (see `presolve_network_lp`)
+            and additionally return `PresolveStats`
+    backend: str
+            name of the LP backend (see `lp_backends`), or 'auto' to choose
+            one by problem size (see `select_lp_backend`). The 'pulp'
+            backend writes the model to temporary files and runs CBC in a
+            separate process, the HiGHS backends solve in-process. Before
+            'auto' became the default, LPs were solved with 'pulp'; for
+            degenerate LPs the backends can return different (equally
+            optimal) bid prices.
+    threads: int
+            maximum number of solver threads, if supported by the backend
+    time_limit: number
+            wall-clock time limit of the solver in seconds
+    structure_cache: lp_cache.LPStructureCache
+            optional on-disk cache of the compiled LP structure
 
     Returns
     -------
@@ -32,17 +86,303 @@ def solve_network_lp(fares, demands, capacities, A, class_names=None,
     optimal revenue: number
             the optimal revenue achieved with the optimal allocation
     trip_names, constraint_names, class_names, leg_names: lists
+    presolve_stats: PresolveStats
+            number of products and legs before and removed by presolve,
+            only returned when `presolve` is True
+
+    Raises
+    ------
+    LPSolveError
+            if the solver does not find an optimal solution, e.g. because
+            the LP is infeasible or the time limit is reached
+    """
+
+    n_classes, n_trips = fares.shape
+
+    null_fares = pd.isnull(fares)
+    null_demands = pd.isnull((demands))
+    demands[null_fares | null_demands] = 0
+    fares[null_fares] = 0
+    if not sp.issparse(A):
+        null_A = pd.isnull(A)
+        A[null_A] = 0
+
+    products = legs = None
+    if presolve:
+        products, legs, presolve_stats = \
+            presolve_network_lp(fares, demands, capacities, A)
+
+    if structure_cache is None:
+        model = NetworkLP(A, n_classes, class_names, trip_names, leg_names,
+                          products, legs)
+    else:
+        model = structure_cache.network_lp(A, n_classes, class_names,
+                                           trip_names, leg_names, products,
+                                           legs)
+    model.update(fares, demands, capacities)
+    allocations, bid_prices, optimal_revenue = model.solve(
+        warm_start=False, backend=backend, threads=threads,
+        time_limit=time_limit)
+
+    result = (allocations, bid_prices, optimal_revenue, model.trip_names,
+              model.constraint_names, model.class_names, model.leg_names)
+
+    if not presolve:
+        return result
+    else:
+        return result + (presolve_stats,)
+
+
+def presolve_network_lp(fares, demands, capacities, A):
+    """Find products and legs that can be left out of the network LP.
+
+    Products with zero demand or zero fare do not contribute revenue and
+    get zero allocations. Legs whose capacity exceeds the total demand of
+    the remaining products using them are never binding and have zero
+    bid prices.
+
+    Parameters
+    ----------
+    fares, demands, capacities, A:
+            see `solve_network_lp`
+
+    Returns
+    -------
+    products: 2D np array of bools
+            size n_classes*n_products, True for products kept in the LP
+    legs: np array of bools
+            True for legs kept in the LP
+    presolve_stats: PresolveStats
     """
+    fares = np.asarray(fares, dtype=float)
+    demands = np.asarray(demands, dtype=float)
+    capacities = np.asarray(capacities, dtype=float)
+
+    with np.errstate(invalid='ignore'):
+        products = (fares > 0) & (demands > 0)
+
+    M = capacity_matrix(A, fares.shape[0])
+    kept_products = products.ravel().astype(float)
+    leg_demand = M.dot(np.where(products, demands, 0).ravel())
+    n_leg_products = M.dot(kept_products)
+
+    never_binding = (capacities > leg_demand) | \
+        ((n_leg_products == 0) & (capacities >= 0))
+    legs = ~never_binding
 
+    presolve_stats = PresolveStats(products.size,
+                                   int(products.size - products.sum()),
+                                   len(legs), int(never_binding.sum()))
+
+    return products, legs, presolve_stats
+
+
+def solve_network_lp_decomposed(fares, demands, capacities, A,
+                                class_names=None, trip_names=None,
+                                leg_names=None, processes=1, **options):
+    """Solve a network LP by solving its independent sub-networks
+    separately.
+
+    Sub-networks are the connected components of the bipartite graph of
+    trips and legs defined by `A`. Parameters and return values are the
+    same as for `solve_network_lp`, additionally the sub-networks are
+    solved in `processes` worker processes (see `solve_network_lps`).
+    Further keyword arguments (e.g. `backend`) are passed to
+    `solve_network_lp`.
+    """
     n_classes, n_trips = fares.shape
     n_legs = len(capacities)
+    capacities = np.asarray(capacities)
 
     null_fares = pd.isnull(fares)
     null_demands = pd.isnull((demands))
-    null_A = pd.isnull(A)
     demands[null_fares | null_demands] = 0
     fares[null_fares] = 0
-    A[null_A] = 0
+    A = _incidence_csr(A)
+
+    class_names, trip_names, leg_names = default_names(
+        n_classes, n_trips, n_legs, class_names, trip_names, leg_names)
+
+    trip_labels, leg_labels, n_components = network_components(A)
+
+    # trips without legs are only limited by demand
+    allocations = np.zeros(fares.shape)
+    no_legs = np.diff(A.indptr) == 0
+    allocations[:, no_legs] = np.where(fares[:, no_legs] > 0,
+                                       demands[:, no_legs], 0)
+    optimal_revenue = np.sum(allocations * fares)
+    bid_prices = np.zeros(n_legs)
+
+    components = [(np.where((trip_labels == c) & ~no_legs)[0],
+                   np.where(leg_labels == c)[0])
+                  for c in range(n_components)]
+    components = [(trips, legs) for trips, legs in components
+                  if len(trips) and len(legs)]
+
+    subproblems = [(fares[:, trips], demands[:, trips], capacities[legs],
+                    A[trips][:, legs], class_names,
+                    [trip_names[i] for i in trips],
+                    [leg_names[i] for i in legs])
+                   for trips, legs in components]
+    results, errors = solve_network_lps(subproblems, processes, **options)
+    if errors:
+        raise next(iter(errors.values()))
+
+    for (trips, legs), result in zip(components, results):
+        allocations[:, trips] = result[0]
+        bid_prices[legs] = result[1]
+        optimal_revenue += result[2]
+
+    constraint_names = ['cap_{}'.format(leg_name) for leg_name in leg_names]
+
+    return allocations, list(bid_prices), optimal_revenue, trip_names, \
+        constraint_names, class_names, leg_names
+
+
+def solve_network_greedy(fares, demands, capacities, A, class_names=None,
+                         trip_names=None, leg_names=None,
+                         subgradient_steps=0):
+    """Approximately solve a network LP with a greedy heuristic.
+
+    Products are allocated in decreasing order of their fare per unit of
+    leg usage, each one as much as its demand and the remaining capacity
+    of its legs allow. The result is a feasible allocation together with
+    Lagrange multipliers of the capacity constraints, which give an upper
+    bound on the optimal revenue
+
+        sum(bid_prices * capacities)
+        + sum(demands * max(0, fares - displacement costs)).
+
+    Initially, the multiplier of a leg whose capacity is used up is the
+    fare per unit of usage of the last product allocated on it, the
+    multipliers can be improved by subgradient steps.
+
+    Parameters
+    ----------
+    fares, demands, capacities, A, class_names, trip_names, leg_names:
+            see `solve_network_lp`
+    subgradient_steps: int
+            number of subgradient steps improving the bid prices
+
+    Returns
+    -------
+    allocations, bid_prices, optimal_revenue, trip_names, constraint_names,
+    class_names, leg_names:
+            like `solve_network_lp`, but the revenue is the revenue of the
+            greedy allocation and the bid prices are the multipliers
+            giving the lowest upper bound
+    upper_bound: number
+            upper bound on the optimal revenue of the LP
+    gap: number
+            relative optimality gap (upper_bound - revenue) / upper_bound
+    """
+    fares = np.array(fares, dtype=float)
+    demands = np.array(demands, dtype=float)
+    capacities = np.asarray(capacities, dtype=float)
+    n_classes, n_trips = fares.shape
+
+    null_fares = pd.isnull(fares)
+    demands[null_fares | pd.isnull(demands)] = 0
+    fares[null_fares] = 0
+    class_names, trip_names, leg_names = default_names(
+        n_classes, n_trips, len(capacities), class_names, trip_names,
+        leg_names)
+
+    M = capacity_matrix(A, n_classes)
+    product_legs = M.T.tocsr()
+    f, d = fares.ravel(), demands.ravel()
+
+    usage = np.asarray(M.sum(axis=0)).ravel()
+    with np.errstate(divide='ignore'):
+        ratios = np.where(usage > 0, f / usage, np.inf)
+    order = np.argsort(-ratios, kind='stable')
+    order = order[(f[order] > 0) & (d[order] > 0)]
+
+    # the allocation is sequential, plain lists are faster than indexing
+    # small np arrays for each product
+    indptr = product_legs.indptr.tolist()
+    indices = product_legs.indices.tolist()
+    data = product_legs.data.tolist()
+    remaining = capacities.tolist()
+    last_ratios = [0.] * len(capacities)
+    x = np.zeros(len(f))
+    for p, demand, ratio in zip(order.tolist(), d[order].tolist(),
+                                ratios[order].tolist()):
+        legs = range(indptr[p], indptr[p + 1])
+        amount = min([demand] + [remaining[indices[i]] / data[i]
+                                 for i in legs])
+        if amount > 0:
+            x[p] = amount
+            for i in legs:
+                remaining[indices[i]] -= data[i] * amount
+                last_ratios[indices[i]] = ratio
+    remaining = np.array(remaining)
+
+    revenue = f.dot(x)
+
+    used_up = remaining <= 1e-9 * np.maximum(1, np.abs(capacities))
+    bid_prices = np.where(used_up, np.array(last_ratios), 0)
+    upper_bound, relaxed = _lagrangian_bound(f, d, capacities, M, bid_prices)
+
+    multipliers = bid_prices
+    for _ in range(subgradient_steps):
+        subgradient = capacities - M.dot(relaxed)
+        norm = subgradient.dot(subgradient)
+        if norm == 0:
+            break
+        # Polyak step towards the greedy revenue
+        step = max(upper_bound - revenue, 0) / norm
+        multipliers = np.maximum(0, multipliers - step * subgradient)
+        bound, relaxed = _lagrangian_bound(f, d, capacities, M, multipliers)
+        if bound < upper_bound:
+            upper_bound, bid_prices = bound, multipliers
+
+    gap = (upper_bound - revenue) / upper_bound if upper_bound > 0 else 0.
+    constraint_names = ['cap_{}'.format(leg_name) for leg_name in leg_names]
+
+    return x.reshape(fares.shape), list(bid_prices), revenue, trip_names, \
+        constraint_names, class_names, leg_names, upper_bound, gap
+
+
+def _lagrangian_bound(fares, demands, capacities, M, bid_prices):
+    """Return the Lagrangian upper bound of the network LP for the
+    multipliers `bid_prices` and the allocation maximizing the
+    Lagrangian."""
+    reduced_fares = fares - M.T.dot(bid_prices)
+    relaxed = np.where(reduced_fares > 0, demands, 0)
+    bound = bid_prices.dot(capacities) + reduced_fares.dot(relaxed)
+
+    return bound, relaxed
+
+
+def network_components(A):
+    """Find the independent sub-networks of a network.
+
+    Parameters
+    ----------
+    A: 2D np array or scipy.sparse matrix
+            incidence matrix, size n_relations*n_legs
+
+    Returns
+    -------
+    trip_labels, leg_labels: np arrays
+            component of each relation and each leg
+    n_components: int
+            number of connected components of the bipartite graph of
+            relations and legs
+    """
+    A = _incidence_csr(A)
+    n_trips = A.shape[0]
+
+    graph = sp.bmat([[None, A], [A.T, None]], format='csr')
+    n_components, labels = connected_components(graph, directed=False)
+
+    return labels[:n_trips], labels[n_trips:], n_components
+
+
+def default_names(n_classes, n_trips, n_legs, class_names=None,
+                  trip_names=None, leg_names=None):
+    """Return class, trip and leg names, generating missing ones."""
 
     if class_names is None:
         class_names = ['class{}'.format(i) for i in np.arange(n_classes) + 1]
@@ -53,22 +393,535 @@ def solve_network_lp(fares, demands, capacities, A, class_names=None,
     if leg_names is None:
         leg_names = ['leg{}'.format(i) for i in np.arange(n_legs) + 1]
 
-    product_names = ['{}_{}'.format(trip, cls)
-                       for cls, trip
-                       in product(class_names, trip_names)]
+    return class_names, trip_names, leg_names
 
-    prob, x = define_lp(fares, product_names)
-    add_demand_constraints(x, demands, product_names)
-    capacity_constraints = add_capacity_constraints(prob, x, A, product_names,
-                                                    capacities, leg_names)
 
-    optimal_revenue = solve_lp(prob)
+def solve_network_lps(problems, processes=None, chunksize=1, **options):
+    """Solve many independent network LPs in a pool of processes.
 
-    allocations = get_allocations(x, product_names, fares.shape)
-    bid_prices, constraint_names = get_shadow_prices(capacity_constraints)
+    Parameters
+    ----------
+    problems: iterable of tuples
+            arguments of `solve_network_lp` for each problem, i.e.
+            (fares, demands, capacities, A) optionally followed by
+            class_names, trip_names and leg_names
+    processes: int
+            number of worker processes, defaults to the number of CPUs.
+            With 1, problems are solved one after another in the current
+            process.
+    chunksize: int
+            number of problems sent to a worker process at once
+    options:
+            further keyword arguments of `solve_network_lp` used for all
+            problems, e.g. `backend` or `time_limit`
+
+    Returns
+    -------
+    results: list
+            return value of `solve_network_lp` for each problem in input
+            order, None for problems that failed
+    errors: dict
+            exception raised for each failed problem, keyed by the
+            position of the problem
+
+    On platforms starting worker processes by spawning (e.g. Windows),
+    call this function from within an `if __name__ == '__main__':` block.
+    """
+    solve = partial(_solve_network_lp_safe, **options)
+    if processes == 1:
+        outcomes = [solve(problem) for problem in problems]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            outcomes = list(executor.map(solve, problems,
+                                         chunksize=chunksize))
+
+    results = [result for result, _ in outcomes]
+    errors = {i: error for i, (_, error) in enumerate(outcomes)
+              if error is not None}
+
+    return results, errors
+
+
+def _solve_network_lp_safe(problem, **options):
+    """Solve a single problem for `solve_network_lps`, returning a tuple
+    (result, exception)."""
+    try:
+        return solve_network_lp(*problem, **options), None
+    except Exception as error:
+        return None, error
+
+
+def randomized_bid_prices(fares, demands, capacities, A, n_scenarios=100,
+                          distribution='poisson', sigmas=None,
+                          quantiles=(0.05, 0.5, 0.95), seed=None,
+                          processes=1, backend='auto'):
+    """Calculate bid prices with the randomized linear program (RLP).
+
+    The network LP is solved for `n_scenarios` demand scenarios sampled
+    around `demands`, the bid prices are the averages of the shadow
+    prices of the capacity constraints (see Talluri and van Ryzin, section
+    3.3.3). All scenarios share one compiled LP structure, only the
+    demands are updated between solves.
+
+    Parameters
+    ----------
+    fares, capacities, A:
+            see `solve_network_lp`
+    demands: 2D np array
+            mean demands for products, size n_classes*n_products
+    n_scenarios: int
+            number of demand scenarios
+    distribution, sigmas, seed:
+            see `sample_demands`
+    quantiles: sequence of numbers
+            quantiles of the bid prices to return, between 0 and 1
+    processes: int
+            number of worker processes, the scenarios are split into one
+            chunk per process
+    backend: str
+            LP backend, see `solve_network_lp`
 
-    return allocations, bid_prices, optimal_revenue, trip_names, \
-           constraint_names, class_names, leg_names
+    Returns
+    -------
+    BidPriceScenarios
+            mean: mean bid price per leg
+            quantiles: bid price quantiles, size len(quantiles)*n_legs
+            bid_prices: bid prices per scenario, size n_scenarios*n_legs
+            revenues: optimal revenue per scenario
+    """
+    fares = np.array(fares, dtype=float)
+    demands = np.nan_to_num(np.array(demands, dtype=float))
+
+    samples = sample_demands(demands, n_scenarios, distribution, sigmas,
+                             seed)
+    structure = compile_network_lp(A, fares.shape[0])
+
+    tasks = [(structure, fares, capacities, chunk, backend)
+             for chunk in np.array_split(samples, processes) if len(chunk)]
+    if processes == 1:
+        results = [_solve_scenarios(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_solve_scenarios, tasks))
+
+    bid_prices = np.vstack([bid_prices for bid_prices, _ in results])
+    revenues = np.concatenate([revenues for _, revenues in results])
+
+    return BidPriceScenarios(bid_prices.mean(axis=0),
+                             np.quantile(bid_prices, quantiles, axis=0),
+                             bid_prices, revenues)
+
+
+def sample_demands(demands, n_scenarios, distribution='poisson', sigmas=None,
+                   seed=None):
+    """Draw demand scenarios.
+
+    Parameters
+    ----------
+    demands: 2D np array
+            mean demands for products, size n_classes*n_products
+    n_scenarios: int
+            number of scenarios
+    distribution: str
+            'poisson' or 'normal', normal demands are truncated at zero
+    sigmas: 2D np array
+            standard deviations of normal demands, defaults to the square
+            root of `demands`
+    seed: int or np.random.Generator
+            seed of the random number generator
+
+    Returns
+    -------
+    3D np array of size n_scenarios*n_classes*n_products
+    """
+    rng = np.random.default_rng(seed)
+    size = (n_scenarios,) + demands.shape
+
+    if distribution == 'poisson':
+        return rng.poisson(demands, size).astype(float)
+    elif distribution == 'normal':
+        if sigmas is None:
+            sigmas = np.sqrt(demands)
+        return np.maximum(rng.normal(demands, sigmas, size), 0)
+
+    raise ValueError("Unknown distribution {!r}, use 'poisson' or "
+                     "'normal'".format(distribution))
+
+
+def _solve_scenarios(task):
+    """Solve the network LP for a chunk of demand scenarios, returning the
+    bid prices and revenues."""
+    structure, fares, capacities, demand_samples, backend = task
+
+    model = NetworkLP.from_structure(structure)
+    model.update(fares=fares, capacities=capacities)
+
+    bid_prices = np.empty((len(demand_samples), model.n_legs))
+    revenues = np.empty(len(demand_samples))
+    for i, demands in enumerate(demand_samples):
+        model.update(demands=demands)
+        _, bid_prices[i], revenues[i] = model.solve(backend=backend)
+
+    return bid_prices, revenues
+
+
+def bid_price_table(fares, demands, capacities, A, leg, capacity_grid=None,
+                    refine=False, tol=1e-6, backend='auto'):
+    """Calculate the bid price of a leg as a function of its capacity.
+
+    The network LP is solved for each capacity of the leg in
+    `capacity_grid` by updating a single model, other legs keep their
+    capacities. The bid price between two grid points is the revenue
+    difference per seat, i.e. f(c) - f(c - 1) on an integer grid.
+
+    The optimal revenue is piecewise linear and concave in the capacity,
+    so the bid price is piecewise constant and non-increasing. With
+    `refine`, the breakpoints between grid points are located exactly by
+    intersecting the tangents of the revenue function (given by the
+    shadow prices) at both points: if the revenue at the intersection
+    lies on the tangents, it is the only breakpoint, otherwise the
+    interval is split there.
+
+    Parameters
+    ----------
+    fares, demands, capacities, A:
+            see `solve_network_lp`
+    leg: int
+            index of the leg
+    capacity_grid: np array
+            capacities of the leg to solve for, defaults to all integers
+            from 0 to its capacity
+    refine: bool
+            find exact breakpoints between the grid points
+    tol: number
+            relative tolerance for comparing bid prices and revenues,
+            segments with bid prices equal within `tol` are merged
+    backend: str
+            LP backend, see `solve_network_lp`. No backend warm starts,
+            each capacity is solved from scratch.
+
+    Returns
+    -------
+    BidPriceTable
+            capacities: increasing capacities
+            bid_prices: bid prices for capacities above the previous and
+            up to the respective capacity, the first one is the shadow
+            price at the smallest grid point
+    """
+    fares = np.array(fares, dtype=float)
+    capacities = np.array(capacities, dtype=float)
+    if capacity_grid is None:
+        capacity_grid = np.arange(np.ceil(capacities[leg]) + 1)
+    capacity_grid = np.unique(np.asarray(capacity_grid, dtype=float))
+
+    model = NetworkLP(A, fares.shape[0])
+    model.update(fares, demands, capacities)
+
+    def solve(capacity):
+        capacities[leg] = capacity
+        model.update(capacities=capacities)
+        _, bid_prices, revenue = model.solve(warm_start=False,
+                                             backend=backend)
+        return capacity, revenue, bid_prices[leg]
+
+    points = [solve(c) for c in capacity_grid]
+    if refine:
+        points += [point for left, right in zip(points, points[1:])
+                   for point in _breakpoints(solve, left, right, tol)]
+        points.sort()
+
+    grid, revenues, shadow_prices = (np.array(p) for p in zip(*points))
+    bid_prices = np.hstack((shadow_prices[:1],
+                            np.diff(revenues) / np.diff(grid)))
+
+    # merge segments with equal bid prices, keeping their upper end
+    keep = np.ones(len(bid_prices), dtype=bool)
+    keep[:-1] = ~_isclose(bid_prices[:-1], bid_prices[1:], tol)
+
+    return BidPriceTable(grid[keep], bid_prices[keep])
+
+
+def _breakpoints(solve, left, right, tol):
+    """Return the solved points (capacity, revenue, shadow price) needed
+    to locate all breakpoints of the revenue function between the points
+    `left` and `right`."""
+    c1, v1, b1 = left
+    c2, v2, b2 = right
+    if _isclose(b1, b2, tol):
+        return []
+
+    # intersection of the tangents at c1 and c2
+    c = (v2 - v1 + b1 * c1 - b2 * c2) / (b1 - b2)
+    if c - c1 <= tol or c2 - c <= tol:
+        return []
+
+    point = solve(c)
+    if _isclose(point[1], v1 + b1 * (c - c1), tol):
+        return [point]
+
+    return (_breakpoints(solve, left, point, tol) + [point] +
+            _breakpoints(solve, point, right, tol))
+
+
+def _isclose(a, b, tol):
+    """Whether `a` and `b` are equal within the relative tolerance `tol`,
+    absolute for values below 1."""
+    return np.abs(a - b) <= tol * np.maximum(1, np.maximum(np.abs(a),
+                                                           np.abs(b)))
+
+
+def lookup_bid_prices(table, capacities):
+    """Look up bid prices in a table returned by `bid_price_table`.
+
+    Parameters
+    ----------
+    table: BidPriceTable
+    capacities: number or np array
+            remaining capacities of the leg
+
+    Returns
+    -------
+    bid prices at the capacities, capacities above the table use the last
+    bid price
+    """
+    segments = np.searchsorted(table.capacities, capacities, side='left')
+    return table.bid_prices[np.minimum(segments, len(table.bid_prices) - 1)]
+
+
+class NetworkLP:
+    """Network LP that is built once for a network and can be re-solved
+    after updating fares, demands and capacities in place.
+
+    Parameters
+    ----------
+    A: 2D np array or scipy.sparse matrix
+            "incidence matrix", size n_relations*n_segments
+             a_ij is 1 when relation i uses segment j and 0 otherwise
+    n_classes: int
+            number of classes
+    class_names, trip_names, leg_names: lists
+            contain optional names
+    products: 2D np array of bools
+            size n_classes*n_relations, only products marked True are
+            part of the LP, the others get zero allocations
+    legs: np array of bools
+            only legs marked True get a capacity constraint, the others
+            get zero bid prices
+
+    Example
+    -------
+    >>> model = NetworkLP(A, n_classes=2)
+    >>> model.update(fares, demands, capacities)
+    >>> allocations, bid_prices, optimal_revenue = model.solve()
+    >>> model.update(capacities=remaining_capacities)
+    >>> allocations, bid_prices, optimal_revenue = model.solve()
+    """
+
+    def __init__(self, A, n_classes, class_names=None, trip_names=None,
+                 leg_names=None, products=None, legs=None):
+
+        structure = compile_network_lp(A, n_classes, class_names,
+                                       trip_names, leg_names)
+        self._set_structure(structure, products, legs)
+
+    @classmethod
+    def from_structure(cls, structure, products=None, legs=None):
+        """Create the model from a structure compiled by
+        `compile_network_lp`, e.g. one loaded from an `LPStructureCache`.
+        """
+        model = cls.__new__(cls)
+        model._set_structure(structure, products, legs)
+        return model
+
+    def _set_structure(self, structure, products, legs):
+        n_legs, n_products = structure.matrix.shape
+        n_classes = len(structure.class_names)
+        n_trips = n_products // n_classes
+
+        self.class_names = structure.class_names
+        self.trip_names = structure.trip_names
+        self.leg_names = structure.leg_names
+        self.constraint_names = ['cap_{}'.format(leg_name)
+                                 for leg_name in self.leg_names]
+        self.shape = (n_classes, n_trips)
+        self.n_legs = n_legs
+        self.fares = np.zeros(self.shape)
+        self.demands = np.zeros(self.shape)
+        self.status = None
+
+        # indices of the products and legs included in the LP
+        if products is None:
+            products = np.ones(self.shape, dtype=bool)
+        if legs is None:
+            legs = np.ones(n_legs, dtype=bool)
+        self.products = np.flatnonzero(products)
+        self.legs = np.flatnonzero(legs)
+
+        self.product_names = [structure.product_names[i]
+                              for i in self.products]
+
+        # LP in array form: max objective @ x
+        # s.t. matrix @ x <= rhs, 0 <= x <= upper
+        self.matrix = structure.matrix
+        if len(self.legs) < n_legs:
+            self.matrix = self.matrix[self.legs]
+        if len(self.products) < n_products:
+            # keeps memory-mapped structures of `LPStructureCache` mapped
+            # unless products are dropped
+            self.matrix = self.matrix[:, self.products]
+        self.objective = np.zeros(len(self.products))
+        self.upper = np.zeros(len(self.products))
+        self.rhs = np.zeros(len(self.legs))
+
+        # PuLP problem, only built when solving with the 'pulp' backend
+        self.prob = self.x = self.capacity_constraints = None
+
+    def update(self, fares=None, demands=None, capacities=None):
+        """Update fares, demands and/or capacities of the model.
+
+        Parameters
+        ----------
+        fares: 2D np array
+                contains fares for products, size n_classes*n_products
+        demands: 2D np array
+                contains demands for products, size n_classes*n_products
+        capacities: list or iterable of numbers
+                contains the capacities on the segments/legs
+        """
+        if fares is not None:
+            self.fares = np.array(fares, dtype=float)
+            self.objective = np.nan_to_num(self.fares).ravel()[self.products]
+
+        if demands is not None:
+            self.demands = np.array(demands, dtype=float)
+
+        if fares is not None or demands is not None:
+            # products with null fare or demand cannot be sold
+            upper_bounds = np.where(pd.isnull(self.fares) |
+                                    pd.isnull(self.demands), 0, self.demands)
+            self.upper = upper_bounds.ravel()[self.products]
+
+        if capacities is not None:
+            self.rhs = np.array(capacities, dtype=float)[self.legs]
+
+        if self.prob is not None:
+            self.update_pulp_lp(fares is not None,
+                                fares is not None or demands is not None,
+                                capacities is not None)
+
+    def update_pulp_lp(self, objective=True, upper=True, rhs=True):
+        """Build the PuLP problem or copy the current objective, upper
+        bounds and/or right-hand sides to it."""
+        if self.prob is None:
+            self.prob, self.x, self.capacity_constraints = pulp_lp(
+                self.objective, self.matrix, self.rhs, self.upper,
+                self.product_names, [self.leg_names[i] for i in self.legs])
+            return
+
+        if objective:
+            self.prob.setObjective(pulp.LpAffineExpression(
+                [(self.x[self.product_names[i]], self.objective[i])
+                 for i in np.flatnonzero(self.objective)]))
+
+        if upper:
+            add_demand_constraints(self.x, self.upper, self.product_names)
+
+        if rhs:
+            for (constraint, _), capacity in zip(self.capacity_constraints,
+                                                 self.rhs):
+                constraint.changeRHS(capacity)
+
+    def solve(self, warm_start=True, backend='auto', threads=None,
+              time_limit=None):
+        """Solve the LP for the current fares, demands and capacities.
+
+        Parameters
+        ----------
+        warm_start: bool
+                start the solver from the previous solution, only used
+                by the 'pulp' backend
+        backend: str
+                name of the LP backend (see `lp_backends`), or 'auto' to
+                choose one by problem size (see `select_lp_backend`)
+        threads: int
+                maximum number of solver threads, if supported by the
+                backend
+        time_limit: number
+                wall-clock time limit of the solver in seconds
+
+        Returns
+        -------
+        allocations: np array
+                the optimal allocation (solutions for decision variables)
+        bid_prices: np array
+                shadow prices of the capacity constraints
+        optimal revenue: number
+                the optimal revenue achieved with the optimal allocation
+
+        Raises
+        ------
+        LPSolveError
+                if the solver does not find an optimal solution, the
+                status code is also stored in the `status` attribute
+        """
+        if backend == 'auto':
+            backend = select_lp_backend(len(self.products), self.matrix.nnz)
+
+        if backend == 'pulp':
+            # re-use the PuLP problem instead of building a new one
+            if self.prob is None:
+                self.update_pulp_lp()
+            solution = solve_pulp_lp(self.prob, self.x, self.product_names,
+                                     self.capacity_constraints, threads,
+                                     time_limit, warm_start)
+        else:
+            solution = get_lp_backend(backend)(
+                self.objective, self.matrix, self.rhs, self.upper,
+                threads=threads, time_limit=time_limit)
+
+        self.status = solution.status
+        if solution.status != 'optimal':
+            raise LPSolveError('LP not solved to optimality, solver status '
+                               '{!r}'.format(solution.status),
+                               solution.status)
+
+        allocations = np.zeros(self.shape)
+        allocations.ravel()[self.products] = solution.x
+
+        bid_prices = np.zeros(self.n_legs)
+        bid_prices[self.legs] = solution.duals
+
+        return allocations, list(bid_prices), solution.objective
+
+
+def compile_network_lp(A, n_classes, class_names=None, trip_names=None,
+                       leg_names=None):
+    """Compile the part of a network LP that only depends on the network.
+
+    Parameters
+    ----------
+    A: 2D np array or scipy.sparse matrix
+            incidence matrix, size n_relations*n_legs
+    n_classes: int
+            number of classes
+    class_names, trip_names, leg_names: lists
+            contain optional names
+
+    Returns
+    -------
+    LPStructure
+            capacity constraint matrix (see `capacity_matrix`), names and
+            the names of all products in the order of the matrix columns
+    """
+    n_trips, n_legs = A.shape
+    class_names, trip_names, leg_names = default_names(
+        n_classes, n_trips, n_legs, class_names, trip_names, leg_names)
+
+    product_names = ['{}_{}'.format(trip, cls)
+                     for cls, trip in product(class_names, trip_names)]
+
+    return LPStructure(capacity_matrix(A, n_classes), class_names,
+                       trip_names, leg_names, product_names)
 
 
 def define_lp(fares, product_names):
@@ -90,9 +943,10 @@ def define_lp(fares, product_names):
     # decision variables: available seats per product
     x = pulp.LpVariable.dicts('x', product_names, lowBound=0)
 
-    # objective function
-    revenue = pulp.lpSum([x[it]*fares.ravel()[i] for i, it in
-                          enumerate(product_names)])
+    # objective function, only products with non-zero fares contribute
+    fares = fares.ravel()
+    revenue = pulp.LpAffineExpression([(x[product_names[i]], fares[i])
+                                       for i in np.flatnonzero(fares)])
     prob += revenue
 
     return prob, x
@@ -100,8 +954,38 @@ def define_lp(fares, product_names):
 
 def add_demand_constraints(x, demands, product_names):
     """Add demands as upper bound to possible seat availability on products."""
-    for i, it in enumerate(product_names):
-        x[it].upBound = demands.ravel()[i]
+    for it, demand in zip(product_names, demands.ravel()):
+        x[it].upBound = demand
+
+
+def capacity_matrix(A, n_classes):
+    """Return the capacity constraint matrix in CSR format.
+
+    Parameters
+    ----------
+    A: 2D np array or scipy.sparse matrix
+        incidence matrix, size n_relations*n_legs
+    n_classes: int
+        number of classes
+
+    Returns
+    -------
+    scipy.sparse.csr_matrix of size n_legs*(n_classes*n_relations), the
+    columns are ordered like the product names (all relations of the
+    first class, then all relations of the second class, ...)
+    """
+    A = _incidence_csr(A)
+
+    return sp.hstack([A.T] * n_classes, format='csr')
+
+
+def _incidence_csr(A):
+    """Return the incidence matrix `A` as a float CSR matrix without the
+    null entries of relations not using a leg. `A` is not modified."""
+    A = sp.csr_matrix(A, dtype=float, copy=True)
+    A.data[np.isnan(A.data)] = 0
+    A.eliminate_zeros()
+    return A
 
 
 def add_capacity_constraints(prob, x, A, product_names, capacities,
@@ -114,8 +998,9 @@ def add_capacity_constraints(prob, x, A, product_names, capacities,
         the LP problem
     x: dict
         contains decision variables (each of which has type pulp.pulp.LpVariable)
-    A: 2D np array
-        incidence matrix, size n_relations*n_legs
+    A: 2D np array or scipy.sparse.csr_matrix
+        incidence matrix, size n_relations*n_legs, or the capacity
+        constraint matrix returned by `capacity_matrix`
     products_names: list
         list of product names (e.g. relation/class combinations)
     capacities: Iterable
@@ -129,14 +1014,19 @@ def add_capacity_constraints(prob, x, A, product_names, capacities,
     where `constraint` is of type pulp.LpConstraint
     and `constraint_name` is of type str
     """
-    n_trips, n_legs = A.shape
-    n_classes = int(len(product_names) / n_trips)
-    A_ = np.tile(A, (n_classes, 1))
+    if not sp.isspmatrix_csr(A):
+        n_classes = int(len(product_names) / A.shape[0])
+        A = capacity_matrix(A, n_classes)
 
+    variables = [x[it] for it in product_names]
+
+    # each leg only gets the products using it (non-zero coefficients)
     capacity_constraints = []
     for leg, leg_name in enumerate(leg_names):
-        leg_load = pulp.lpSum([x[it]*A_[i, leg] for i, it
-                               in enumerate(product_names)])
+        start, end = A.indptr[leg], A.indptr[leg + 1]
+        leg_load = pulp.LpAffineExpression(
+            [(variables[i], a) for i, a in zip(A.indices[start:end],
+                                               A.data[start:end])])
         capacity_constraint = (leg_load <= capacities[leg],
                                "cap_{}".format(leg_name))
         prob += capacity_constraint
@@ -147,7 +1037,9 @@ def add_capacity_constraints(prob, x, A, product_names, capacities,
 
 def get_allocations(x, product_names, out_shape):
     """Return allocations after solving of LP and reshape them."""
-    allocations = [x[it].value() for it in product_names]
+    # variables that neither appear in the objective nor in a constraint
+    # are not passed to the solver and have no value
+    allocations = [x[it].value() or 0 for it in product_names]
     return np.array(allocations).reshape(out_shape)
 
 
@@ -158,15 +1050,171 @@ def get_shadow_prices(constraints):
     return shadow_prices, constraint_names
 
 
-def solve_lp(prob):
+def solve_lp(prob, solver=None):
     """Solve LP, return min/max."""
-    optimization_result = prob.solve()
-    assert optimization_result == pulp.LpStatusOptimal
+    prob.solve(solver)
+    status = pulp_status(prob)
+    if status != 'optimal':
+        raise LPSolveError('LP not solved to optimality, solver status '
+                           '{!r}'.format(status), status)
     optimal_value = pulp.value(prob.objective)
 
     return optimal_value
 
 
+def pulp_status(prob):
+    """Return the status code (see `LP_STATUS`) of a solved PuLP problem."""
+    if prob.status == pulp.LpStatusOptimal:
+        # CBC reports solutions found before hitting a limit as optimal
+        if prob.sol_status == pulp.LpSolutionOptimal:
+            return 'optimal'
+        return 'limit_reached'
+
+    return {pulp.LpStatusInfeasible: 'infeasible',
+            pulp.LpStatusUnbounded: 'unbounded',
+            pulp.LpStatusNotSolved: 'not_solved'}.get(prob.status,
+                                                      'undefined')
+
+
+def pulp_lp(objective, matrix, rhs, upper, product_names, leg_names):
+    """Build a PuLP problem from an LP in array form (see
+    `register_lp_backend`).
+
+    Returns
+    -------
+    tuple of the form (LP problem, decision variables, capacity constraints)
+    """
+    prob, x = define_lp(objective, product_names)
+    add_demand_constraints(x, upper, product_names)
+    capacity_constraints = add_capacity_constraints(
+        prob, x, matrix, product_names, rhs, leg_names)
+
+    return prob, x, capacity_constraints
+
+
+def solve_pulp_lp(prob, x, product_names, capacity_constraints, threads=None,
+                  time_limit=None, warm_start=False):
+    """Solve a PuLP problem built by `pulp_lp` with CBC.
+
+    Returns
+    -------
+    LPSolution
+    """
+    solver = pulp.PULP_CBC_CMD(msg=False, warmStart=warm_start,
+                               threads=threads, timeLimit=time_limit)
+    prob.solve(solver)
+    status = pulp_status(prob)
+    if status != 'optimal':
+        return LPSolution(None, None, None, status)
+
+    allocations = get_allocations(x, product_names, len(product_names))
+    shadow_prices, _ = get_shadow_prices(capacity_constraints)
+
+    return LPSolution(allocations, np.array(shadow_prices, dtype=float),
+                      pulp.value(prob.objective), status)
+
+
+def solve_pulp(objective, matrix, rhs, upper, threads=None, time_limit=None):
+    """LP backend using PuLP and the CBC command line solver."""
+    product_names = ['x{}'.format(i) for i in range(len(objective))]
+    leg_names = ['leg{}'.format(i) for i in range(len(rhs))]
+    prob, x, capacity_constraints = pulp_lp(objective, matrix, rhs, upper,
+                                            product_names, leg_names)
+
+    return solve_pulp_lp(prob, x, product_names, capacity_constraints,
+                         threads, time_limit)
+
+
+# status codes of scipy.optimize.linprog
+_linprog_status = {0: 'optimal', 1: 'limit_reached', 2: 'infeasible',
+                   3: 'unbounded', 4: 'numerical_error'}
+
+
+def solve_highs(objective, matrix, rhs, upper, threads=None, time_limit=None,
+                method='highs'):
+    """LP backend using HiGHS through `scipy.optimize.linprog`.
+
+    The duals are taken from the marginals of the inequality constraints.
+    `threads` is not supported by scipy and ignored.
+    """
+    n_products, n_legs = len(objective), len(rhs)
+    if n_products == 0:
+        status = 'optimal' if np.all(rhs >= 0) else 'infeasible'
+        return LPSolution(np.zeros(0), np.zeros(n_legs), 0., status)
+
+    options = {} if time_limit is None else {'time_limit': time_limit}
+    result = linprog(-objective,
+                     A_ub=matrix if n_legs else None,
+                     b_ub=rhs if n_legs else None,
+                     bounds=np.column_stack((np.zeros(n_products), upper)),
+                     method=method, options=options)
+
+    status = _linprog_status.get(result.status, 'undefined')
+    if status != 'optimal':
+        return LPSolution(None, None, None, status)
+
+    duals = -result.ineqlin.marginals if n_legs else np.zeros(0)
+
+    return LPSolution(result.x, duals, -result.fun, status)
+
+
+_lp_backends = {}
+
+
+def register_lp_backend(name, solve):
+    """Register an LP backend.
+
+    Parameters
+    ----------
+    name: str
+            name used to select the backend
+    solve: callable
+            solve(objective, matrix, rhs, upper, threads=None,
+            time_limit=None) maximizes objective @ x subject to
+            matrix @ x <= rhs and 0 <= x <= upper, where `matrix` is a
+            scipy.sparse.csr_matrix and the others are np arrays. It
+            returns an `LPSolution` with the non-negative duals of the
+            constraints, `x`, `duals` and `objective` may be None if
+            the status is not 'optimal'.
+    """
+    _lp_backends[name] = solve
+
+
+def get_lp_backend(name):
+    """Return the solve function of a registered LP backend."""
+    try:
+        return _lp_backends[name]
+    except KeyError:
+        raise ValueError('Unknown LP backend {!r}, available backends: '
+                         '{}'.format(name, ', '.join(lp_backends())))
+
+
+def lp_backends():
+    """Return the names of the registered LP backends."""
+    return sorted(_lp_backends)
+
+
+def select_lp_backend(n_variables, n_nonzeros):
+    """Choose an LP backend by problem size.
+
+    Only in-process backends are chosen, which get the LP directly from
+    the arrays and do not write any files. Small and medium problems are
+    solved with the HiGHS simplex solver, problems with at least
+    `AUTO_IPM_MIN_NONZEROS` non-zeros in the constraint matrix with the
+    HiGHS interior point solver, which scales better to large sparse LPs.
+    Note that for degenerate LPs the two methods can return different
+    (equally optimal) bid prices.
+    """
+    if n_nonzeros >= AUTO_IPM_MIN_NONZEROS:
+        return 'highs-ipm'
+    return 'highs'
+
+
+register_lp_backend('pulp', solve_pulp)
+register_lp_backend('highs', solve_highs)
+register_lp_backend('highs-ipm', partial(solve_highs, method='highs-ipm'))
+
+
 def wrap_df(func):
     """Make `solve_network_lp` accepting pandas data frames."""
     @wraps(func)
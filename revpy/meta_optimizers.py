@@ -1,7 +1,34 @@
-from revpy.optimizers import calc_EMSRb
-from revpy.fare_transformation import fare_trafo_decorator
+from revpy.cache import memoize
+from revpy.optimizers import calc_EMSRb, calc_EMSRb_batch
+from revpy.fare_transformation import fare_trafo_decorator, \
+    batch_fare_trafo_decorator
 
 
+@memoize
 @fare_trafo_decorator
 def calc_EMSRb_MR(fares, demands, sigmas=None, cap=None):
     return calc_EMSRb(fares, demands, sigmas)
+
+
+@batch_fare_trafo_decorator
+def calc_EMSRb_MR_batch(fares, demands, sigmas=None, cap=None):
+    """EMSRb-MR for several flights at once.
+
+    Parameters
+    ----------
+    fares: 2D np array
+           fares, size n_flights*n_classes, each row provided in
+           decreasing order and padded with trailing NaNs
+    demands: 2D np array
+           demands for the fares in `fares`
+    sigmas: 2D np array
+           standard deviations of demands
+    cap: np array
+           capacity of each flight
+
+    Returns
+    -------
+    2D np array of protection levels, NaN for inefficient strategies and
+    padded classes
+    """
+    return calc_EMSRb_batch(fares, demands, sigmas)
@@ -1,7 +1,8 @@
 import numpy as np
-from copy import deepcopy
-from scipy.linalg import solve
+from collections import namedtuple
+from revpy import mnl
 from revpy.exceptions import InvalidInputParameters
+from revpy.helpers import segment_ids, segment_sums
 
 """
 Multi-flight recapture method is a simple heuristics that allows to estimate
@@ -14,9 +15,22 @@ airline bookings", Journal of Revenue and Pricing Management (2008)
 
 NOTE: current implementation introduces `calibrate_no_booking` method that
 is not part of the original paper
+
+The functions taking dicts keyed by product are adapters of the `*_arrays`
+functions, which take np arrays aligned by product.
 """
 
 
+ClassLevelEstimates = namedtuple('ClassLevelEstimates',
+                                 ['demand', 'spill', 'recapture'])
+
+HostLevelEstimates = namedtuple('HostLevelEstimates',
+                                ['demand', 'spill', 'recapture'])
+
+BatchEstimates = namedtuple('BatchEstimates',
+                            ['estimates', 'host_estimates', 'errors'])
+
+
 def estimate_host_level(observed, availability, probs, nofly_prob):
     """ Estimate demand, spill and recapture using multi-flight recapture
     method (MFRM) on host-level
@@ -39,24 +53,55 @@ def estimate_host_level(observed, availability, probs, nofly_prob):
         Estimated demand, spill and recapture for H
     """
 
-    demand = spill = recapture = 0
+    if not probs:
+        return 0, 0, 0
 
-    if probs:
-        # probability of selecting an open element from market set M
-        prob_market_open = nofly_prob + sum([pr * availability.get(p, 0)
-                                             for p, pr in probs.items()])
+    _, *arrays = product_arrays(observed, availability, probs)
+    return estimate_host_level_arrays(*arrays, nofly_prob,
+                                      sum(observed.values()))
 
-        recapture_rate = (prob_market_open - nofly_prob) / prob_market_open
 
-        # probability of selecting a closed element from host set H
-        prob_host_closed = (1 - prob_market_open) / (1 - nofly_prob)
+def estimate_host_level_arrays(observed, availability, probs, nofly_prob,
+                               total_observed=None):
+    """ Estimate demand, spill and recapture using multi-flight recapture
+    method (MFRM) on host-level
 
-        # total observed demand
-        total_odemand = sum(observed.values())
-        demand, spill, recapture = demand_mass_balance_h(total_odemand,
-                                                         prob_host_closed,
-                                                         recapture_rate)
-    return demand, spill, recapture
+    Parameters
+    ----------
+    observed: np array
+        Observed demand for each product
+    availability: np array
+        Availability of demand open during period considered
+    probs: np array
+        Customer selection probability for a product
+    nofly_prob: float
+        "Do not fly" probability
+    total_observed: float
+        Total observed demand of the host, defaults to the sum of
+        `observed`. Can include products without selection probability.
+
+    Returns
+    -------
+    tuple
+        Estimated demand, spill and recapture for H
+    """
+
+    if len(probs) == 0:
+        return 0, 0, 0
+
+    if total_observed is None:
+        total_observed = np.sum(observed)
+
+    # probability of selecting an open element from market set M
+    prob_market_open = nofly_prob + np.dot(probs, availability)
+
+    recapture_rate = (prob_market_open - nofly_prob) / prob_market_open
+
+    # probability of selecting a closed element from host set H
+    prob_host_closed = (1 - prob_market_open) / (1 - nofly_prob)
+
+    return demand_mass_balance_h(total_observed, prob_host_closed,
+                                 recapture_rate)
 
 
 def estimate_class_level(observed, availability, probs, nofly_prob,
@@ -81,43 +126,155 @@ def estimate_class_level(observed, availability, probs, nofly_prob,
         Estimated demand, spill and recapture for H
     """
 
-    host_estimates = estimate_host_level(observed, availability, probs,
-                                         nofly_prob)
-    _, host_spill, host_recapture = host_estimates
-
-    estimates = {}
-    total_odemand = sum(observed.values())
-
-    for product in probs.keys():
-        odemand = observed.get(product, 0)
-        avail = availability.get(product, 0)
-
-        if avail == 0 and odemand > 0:
-            raise InvalidInputParameters('Non zero observed demand with '
-                                         'zero availability')
-
-        if odemand:
-            estimate = demand_mass_balance_c(total_odemand, odemand, avail,
-                                             host_recapture)
-            estimates[product] = {
-                'demand': estimate[0],
-                'spill': estimate[1],
-                'recapture': estimate[2]
-            }
-        else:
-            estimates[product] = {
-                'demand': 0,
-                'spill': 0,
-                'recapture': 0
-            }
+    products, *arrays = product_arrays(observed, availability, probs)
+    estimates = estimate_class_level_arrays(*arrays, nofly_prob, calibrate,
+                                            sum(observed.values()))
+
+    return estimates_to_dict(products, estimates)
+
+
+def estimate_class_level_arrays(observed, availability, probs, nofly_prob,
+                                calibrate=True, total_observed=None):
+    """ Estimate demand, spill and recapture using multi-flight recapture
+    method (MFRM) on class-level
+
+    Parameters
+    ----------
+    observed: np array
+        Observed demand for each product
+    availability: np array
+        Availability of demand open during period considered
+    probs: np array
+        Customer selection probability for a product
+    nofly_prob: float
+        "Do not fly" probability
+    calibrate: bool
+        Distribute unaccounted spill to products without bookings, see
+        `calibrate_no_booking_arrays`
+    total_observed: float
+        Total observed demand of the host, defaults to the sum of
+        `observed`. Can include products without selection probability.
+
+    Returns
+    -------
+    ClassLevelEstimates
+        Estimated demand, spill and recapture arrays
+    """
+
+    total_observed = None if total_observed is None else [total_observed]
+    result = estimate_class_level_batch(observed, availability, probs,
+                                        nofly_prob, [0, len(probs)],
+                                        calibrate, total_observed)
+    if result.errors:
+        raise next(iter(result.errors.values()))
+
+    return result.estimates
 
+
+def estimate_class_level_batch(observed, availability, probs, nofly_probs,
+                               offsets, calibrate=True, total_observed=None):
+    """ Estimate demand, spill and recapture using multi-flight recapture
+    method (MFRM) on class-level for many markets at once
+
+    The products of all markets are concatenated, the products of market
+    i are at offsets[i]:offsets[i + 1].
+
+    Parameters
+    ----------
+    observed: np array
+        Observed demand for each product
+    availability: np array
+        Availability of demand open during period considered
+    probs: np array
+        Customer selection probability for a product
+    nofly_probs: float or np array
+        "Do not fly" probability of each market
+    offsets: np array
+        Start of the products of each market followed by the total number
+        of products
+    calibrate: bool
+        Distribute unaccounted spill to products without bookings, see
+        `calibrate_no_booking_arrays`
+    total_observed: np array
+        Total observed demand of each market, defaults to the sums of
+        `observed`
+
+    Returns
+    -------
+    BatchEstimates
+        estimates: ClassLevelEstimates of all products
+        host_estimates: HostLevelEstimates of each market
+        errors: InvalidInputParameters of each invalid market by market
+        index, estimates of invalid markets are nan
+    """
+
+    observed = np.asarray(observed, dtype=float)
+    availability = np.asarray(availability, dtype=float)
+    probs = np.asarray(probs, dtype=float)
+    offsets = np.asarray(offsets)
+    nofly_probs = np.broadcast_to(np.asarray(nofly_probs, dtype=float),
+                                  len(offsets) - 1)
+    markets = segment_ids(offsets)
+
+    if total_observed is None:
+        total_observed = segment_sums(observed, offsets)
+    total_observed = np.asarray(total_observed, dtype=float)
+
+    errors = {}
+    booked_closed = segment_sums((availability == 0) & (observed > 0),
+                                 offsets) > 0
+    for market in np.flatnonzero(booked_closed):
+        errors[market] = InvalidInputParameters('Non zero observed demand '
+                                                'with zero availability')
+
+    # host level, see `estimate_host_level_arrays`
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prob_market_open = nofly_probs + segment_sums(probs * availability,
+                                                      offsets)
+        recapture_rate = (prob_market_open - nofly_probs) / prob_market_open
+        prob_host_closed = (1 - prob_market_open) / (1 - nofly_probs)
+        denominator = 1 - prob_host_closed + recapture_rate * prob_host_closed
+
+        empty = offsets[:-1] == offsets[1:]
+        singular = (denominator == 0) & ~empty
+        for market in np.flatnonzero(singular & ~booked_closed):
+            errors[market] = InvalidInputParameters(
+                'Demand mass balance is singular, no product is available')
+
+        host_demand = np.where(empty, 0, total_observed / denominator)
+        host_spill = np.where(empty, 0, prob_host_closed * host_demand)
+        host_recapture = np.where(empty, 0, recapture_rate * host_spill)
+
+        invalid = booked_closed | singular
+        host_demand[invalid] = host_spill[invalid] = \
+            host_recapture[invalid] = np.nan
+
+        # class level, see `demand_mass_balance_c`
+        booked = observed != 0
+        recapture = np.where(booked, host_recapture[markets] * observed /
+                             total_observed[markets], 0)
+        demand = np.where(booked, (observed - recapture) / availability, 0)
+        spill = (1 - availability) * demand
+
+    estimates = ClassLevelEstimates(demand, spill, recapture)
     if calibrate:
-        estimates = calibrate_no_booking(estimates, observed, availability,
-                                         probs, host_spill)
-    return estimates
+        estimates = calibrate_no_booking_arrays(estimates, observed,
+                                                availability, probs,
+                                                host_spill, offsets,
+                                                copy=False)
+
+    invalid_products = invalid[markets]
+    estimates = ClassLevelEstimates(*(np.where(invalid_products, np.nan, e)
+                                      for e in estimates))
 
+    return BatchEstimates(estimates,
+                          HostLevelEstimates(host_demand, host_spill,
+                                             host_recapture),
+                          {int(m): errors[m] for m in sorted(errors)})
 
-def calibrate_no_booking(estimates, observed, availability, probs, host_spill):
+
+def calibrate_no_booking(estimates, observed, availability, probs, host_spill,
+                         copy=True):
     """Demand mass balance equation has many solution in case of observed
     demand is 0. If observed demand is 0, then unconstrained demand equal
     spill and recapture is 0. This method redictrobite unaccounted spill
@@ -135,16 +292,20 @@ def calibrate_no_booking(estimates, observed, availability, probs, host_spill):
         Customer selection probability for a product
     host_spill: float
         Estimated host level spill
+    copy: bool
+        Calibrate copies of the estimates of each product, otherwise
+        `estimates` is updated in place
 
     Returns
     -------
-    tuple
-        Estimated demand, spill and recapture for H
+    dict
+        Calibrated demand, spill and recapture by product
     """
 
-    estimates = deepcopy(estimates)
+    if copy:
+        estimates = {p: dict(e) for p, e in estimates.items()}
 
-    class_spill = sum([e['spill'] for e in estimates.values()])
+    class_spill = sum(e['spill'] for e in estimates.values())
 
     # unaccounted spill - difference between host level spill and
     # sum spill for all products
@@ -158,18 +319,81 @@ def calibrate_no_booking(estimates, observed, availability, probs, host_spill):
         weights = {p: probs[p] * (1 - availability.get(p, 0))
                    for p in observed}
 
-        # normalized weights
-        weights = {p: w / sum(weights.values()) for p, w in weights.items()}
+        total_weights = sum(weights.values())
+        if total_weights == 0:
+            return estimates
 
         for p, w in weights.items():
-            estimates[p]['spill'] = unaccounted_spill * w
-            estimates[p]['demand'] = unaccounted_spill * w
+            spill = unaccounted_spill * w / total_weights
+            estimates[p]['spill'] = spill
+            estimates[p]['demand'] = spill
+
+    return estimates
+
+
+def calibrate_no_booking_arrays(estimates, observed, availability, probs,
+                                host_spill, offsets=None, copy=True):
+    """Distribute unaccounted spill to products with no observed demand,
+    see `calibrate_no_booking`
+
+    Parameters
+    ----------
+    estimates: ClassLevelEstimates
+        Estimates of `estimate_class_level_arrays`
+    observed: np array
+        Observed demand for each product
+    availability: np array
+        Availability of demand open during period considered
+    probs: np array
+        Customer selection probability for a product
+    host_spill: float or np array
+        Estimated host level spill of each market
+    offsets: np array
+        Markets of the products, see `estimate_class_level_batch`, by
+        default all products belong to one market
+    copy: bool
+        Calibrate copies of demand and spill, otherwise the float arrays
+        of `estimates` are updated in place
+
+    Returns
+    -------
+    ClassLevelEstimates
+        Calibrated estimates
+    """
+
+    if offsets is None:
+        offsets = [0, len(observed)]
+    markets = segment_ids(offsets)
+
+    # unaccounted spill - difference between host level spill and
+    # sum spill for all products
+    unaccounted_spill = host_spill - segment_sums(estimates.spill, offsets)
+
+    no_booking = observed == 0
+    weights = np.where(no_booking, probs * (1 - availability), 0)
+    total_weights = segment_sums(weights, offsets)
+
+    with np.errstate(invalid='ignore'):
+        calibrate = (unaccounted_spill > 0) & (total_weights > 0)
+    no_booking &= calibrate[markets]
+
+    if copy:
+        estimates = ClassLevelEstimates(
+            np.array(estimates.demand, dtype=float),
+            np.array(estimates.spill, dtype=float), estimates.recapture)
+
+    no_booking_markets = markets[no_booking]
+    spill = unaccounted_spill[no_booking_markets] * weights[no_booking] / \
+        total_weights[no_booking_markets]
+    estimates.demand[no_booking] = spill
+    estimates.spill[no_booking] = spill
 
     return estimates
 
 
 def selection_probs(utilities, market_share):
-    """Customer selection probability for all products and 'do not fly'
+    """Customer selection probability for all products and 'do not fly',
+    see `mnl.selection_probs` for arrays of many markets
 
     Parameters
     ----------
@@ -184,17 +408,11 @@ def selection_probs(utilities, market_share):
         Selection probs for each product and 'do not fly' prob
     """
 
-    exp_sum = sum([np.exp(u) for u in utilities.values()])
-    exp_nofly_utility = exp_sum * (1 - market_share) / market_share
-    exp_sum += exp_nofly_utility
-
-    # customer selection probability for all products
-    probs = {p: (np.exp(u) / exp_sum) for p, u in utilities.items()}
+    products = list(utilities)
+    probs, nofly_prob = mnl.selection_probs(
+        [utilities[p] for p in products], market_share)
 
-    # customer selection probability for ‘do not fly’
-    nofly_prob = exp_nofly_utility / exp_sum
-
-    return probs, nofly_prob
+    return dict(zip(products, probs.tolist())), nofly_prob[0]
 
 
 def demand_mass_balance_c(host_odemand, class_odemand, avail, host_recapture):
@@ -204,9 +422,9 @@ def demand_mass_balance_c(host_odemand, class_odemand, avail, host_recapture):
     ----------
     host_odemand: int
         Observerd host demand
-    class_odemand: int
+    class_odemand: int or np array
         Observed class demand
-    avail: dict
+    avail: float or np array
         Availability of demand open during period considered
     host_recapture: float
         Estimated host level recapture
@@ -219,17 +437,18 @@ def demand_mass_balance_c(host_odemand, class_odemand, avail, host_recapture):
 
     # if observed demand of a class is 0 demand mass balance can't
     # estimate demand and spill alone without additioanl information
-    demand = spill = recapture = 0
-    if class_odemand:
-        recapture = host_recapture * class_odemand / host_odemand
+    class_odemand = np.asarray(class_odemand, dtype=float)
+    booked = class_odemand != 0
 
-        # availability of demand closed during period considered
-        k = 1 - avail
-        A = np.array([[1, -1], [-k, 1]])
-        B = np.array([class_odemand - recapture, 0])
-        demand, spill = solve(A, B)
+    # closed form of d - s = o - r, s = (1 - a) d
+    with np.errstate(divide='ignore', invalid='ignore'):
+        recapture = np.where(booked,
+                             host_recapture * class_odemand / host_odemand, 0)
+        demand = np.where(booked, (class_odemand - recapture) / avail, 0)
+    spill = (1 - np.asarray(avail)) * demand
 
-    return demand, spill, recapture
+    # scalars for scalar input
+    return demand[()], spill[()], recapture[()]
 
 
 def demand_mass_balance_h(odemand, close_prob, recapture_rate):
@@ -250,9 +469,42 @@ def demand_mass_balance_h(odemand, close_prob, recapture_rate):
         Estimated demand, spill and recapture
     """
 
-    A = np.array([[1, -1, 1], [-close_prob, 1, 0], [0, -recapture_rate, 1]])
-    B = np.array([odemand, 0, 0])
-
-    demand, spill, recapture = solve(A, B)
+    # closed form of d - s + r = o, s = p d, r = rate s, which is singular
+    # if no product is available
+    denominator = 1 - close_prob + recapture_rate * close_prob
+    if denominator == 0:
+        raise InvalidInputParameters('Demand mass balance is singular, no '
+                                     'product is available')
+    demand = odemand / denominator
+    spill = close_prob * demand
+    recapture = recapture_rate * spill
 
     return demand, spill, recapture
+
+
+def product_arrays(observed, availability, probs):
+    """Align the dicts of the class-level estimation by the products in
+    `probs`.
+
+    Returns
+    -------
+    tuple
+        Products, observed demand, availability and selection probability
+        arrays
+    """
+
+    products = list(probs)
+    observed = np.array([observed.get(p, 0) for p in products], dtype=float)
+    availability = np.array([availability.get(p, 0) for p in products],
+                            dtype=float)
+    probs = np.array([probs[p] for p in products], dtype=float)
+
+    return products, observed, availability, probs
+
+
+def estimates_to_dict(products, estimates):
+    """Convert `ClassLevelEstimates` to a dict of estimates by product."""
+
+    return {p: {'demand': demand, 'spill': spill, 'recapture': recapture}
+            for p, demand, spill, recapture
+            in zip(products, *(np.asarray(e).tolist() for e in estimates))}
@@ -0,0 +1,240 @@
+"""
+Streaming MFRM estimation over booking files larger than memory.
+
+The records of a file are read in chunks with pandas. Each record is a
+product of a market with its observed demand, availability and selection
+probability, the records of a market must be contiguous. Markets completed
+by a chunk are estimated together with `mfrm.estimate_class_level_batch`,
+the records of the last market of the chunk are carried over to the next
+one, so that memory is bounded by the chunk size and the largest market
+(unless all market keys are kept to check the contiguity of the whole
+file, see `check_contiguous`):
+
+>>> for market in estimate_class_level_stream('bookings.csv', nofly_prob=0.3,
+...                                           market_columns=['od', 'date']):
+...     print(market.market, market.products, market.estimates.demand)
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from revpy.mfrm import (ClassLevelEstimates, HostLevelEstimates,
+                        estimate_class_level_batch)
+
+
+MarketEstimates = namedtuple('MarketEstimates', ['market', 'products',
+                                                 'estimates',
+                                                 'host_estimates', 'error'])
+
+
+def estimate_class_level_stream(path, nofly_prob=None, market_columns='market',
+                                product_column='product',
+                                observed_column='observed',
+                                availability_column='availability',
+                                prob_column='prob', nofly_column=None,
+                                calibrate=True, check_contiguous=False,
+                                file_format=None, chunksize=100000,
+                                **read_options):
+    """Estimate demand, spill and recapture with MFRM on class-level for
+    each market of a CSV or newline-delimited JSON file
+
+    Parameters
+    ----------
+    path: str or file
+        CSV or newline-delimited JSON file
+    nofly_prob: float
+        "Do not fly" probability of all markets, see `nofly_column`
+    market_columns: str or list
+        Column(s) identifying a market
+    product_column: str
+        Column identifying a product within its market
+    observed_column, availability_column, prob_column: str
+        Columns of observed demand, availability and customer selection
+        probability of the products
+    nofly_column: str
+        Column of the "do not fly" probability of the market of a record,
+        used instead of `nofly_prob`
+    calibrate: bool
+        Distribute unaccounted spill to products without bookings
+    check_contiguous: bool
+        Check that the records of a market are contiguous in the whole
+        file. This keeps the keys of all markets in memory, otherwise only
+        the markets of each chunk read are checked, see `market_chunks`.
+    file_format: str
+        'csv' or 'json', by default derived from the file extension
+    chunksize: int
+        Number of records read at once
+    read_options:
+        Passed to `pd.read_csv` or `pd.read_json`
+
+    Yields
+    ------
+    MarketEstimates
+        market: key of the market, a tuple for several market columns
+        products: products of the market
+        estimates: ClassLevelEstimates of the products
+        host_estimates: HostLevelEstimates of the market
+        error: InvalidInputParameters if the market is invalid, its
+        estimates are nan, otherwise None
+
+    Raises
+    ------
+    ValueError
+        If the records of a market are found not to be contiguous, see
+        `check_contiguous`
+    """
+
+    if (nofly_prob is None) == (nofly_column is None):
+        raise ValueError('Either nofly_prob or nofly_column is required')
+
+    columns = [market_columns] if isinstance(market_columns, str) \
+        else list(market_columns)
+
+    # keys of all completed markets, see `check_contiguous`
+    completed = set()
+
+    for records in market_chunks(path, columns, file_format, chunksize,
+                                 **read_options):
+        starts = np.flatnonzero(_key_changes(records, columns))
+        offsets = np.append(starts, len(records))
+        keys = _keys(records, columns, starts)
+
+        if check_contiguous:
+            for key in keys:
+                if key in completed:
+                    raise ValueError('Records of market {!r} are not '
+                                     'contiguous'.format(key))
+                completed.add(key)
+
+        if nofly_column is None:
+            nofly_probs = nofly_prob
+        else:
+            nofly_probs = records[nofly_column].to_numpy(float)[starts]
+
+        result = estimate_class_level_batch(
+            records[observed_column].to_numpy(float),
+            records[availability_column].to_numpy(float),
+            records[prob_column].to_numpy(float), nofly_probs, offsets,
+            calibrate)
+
+        products = records[product_column].tolist()
+        for i, key in enumerate(keys):
+            market = slice(offsets[i], offsets[i + 1])
+            yield MarketEstimates(
+                key, products[market],
+                ClassLevelEstimates(*(e[market] for e in result.estimates)),
+                HostLevelEstimates(*(e[i] for e in result.host_estimates)),
+                result.errors.get(i))
+
+
+def market_chunks(path, market_columns, file_format=None, chunksize=100000,
+                  **read_options):
+    """Read a CSV or newline-delimited JSON file in chunks of complete
+    markets
+
+    Parameters
+    ----------
+    path: str or file
+        CSV or newline-delimited JSON file
+    market_columns: list
+        Columns identifying a market
+    file_format: str
+        'csv' or 'json', by default derived from the file extension
+    chunksize: int
+        Number of records read at once
+    read_options:
+        Passed to `pd.read_csv` or `pd.read_json`
+
+    Yields
+    ------
+    pd.DataFrame
+        Records of the markets completed by a chunk, the records of a
+        market larger than `chunksize` are yielded at once
+
+    Raises
+    ------
+    ValueError
+        If a market reappears within a chunk read
+    """
+
+    reader = _reader(path, file_format, chunksize, **read_options)
+    # pieces of the last market, which may continue in the next chunk,
+    # concatenated once the market is complete
+    pending = []
+    try:
+        for chunk in reader:
+            changes = _key_changes(chunk, market_columns)
+            if pending and len(chunk):
+                changes[0] = _key(chunk, market_columns, 0) != \
+                    _key(pending[-1], market_columns, -1)
+            starts = np.flatnonzero(changes)
+            _check_unique(chunk, market_columns, starts, pending)
+
+            if not len(starts):
+                pending.append(chunk)
+                continue
+
+            last_start = starts[-1]
+            if last_start > 0:
+                pending.append(chunk.iloc[:last_start])
+            if pending:
+                yield pd.concat(pending, ignore_index=True)
+            pending = [chunk.iloc[last_start:]]
+    finally:
+        reader.close()
+
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def _reader(path, file_format, chunksize, **read_options):
+    if file_format is None:
+        name = str(getattr(path, 'name', path)).lower()
+        if name.endswith('.csv'):
+            file_format = 'csv'
+        elif name.endswith(('.json', '.jsonl', '.ndjson')):
+            file_format = 'json'
+        else:
+            raise ValueError('Unknown format of {}, file_format is '
+                             'required'.format(name))
+
+    if file_format == 'csv':
+        return pd.read_csv(path, chunksize=chunksize, **read_options)
+    if file_format == 'json':
+        return pd.read_json(path, lines=True, chunksize=chunksize,
+                            **read_options)
+    raise ValueError('Unknown file_format {}'.format(file_format))
+
+
+def _key_changes(records, columns):
+    """Whether each record starts a new market."""
+    keys = records[columns]
+    changes = (keys != keys.shift()).any(axis=1).to_numpy()
+    if len(changes):
+        changes[0] = True
+    return changes
+
+
+def _key(records, columns, i):
+    return tuple(records[columns].iloc[i])
+
+
+def _check_unique(chunk, columns, starts, pending):
+    """Raise if the markets starting in a chunk and the pending market
+    are not unique."""
+    keys = set() if not pending else {_key(pending[-1], columns, -1)}
+    for start in starts:
+        key = _key(chunk, columns, start)
+        if key in keys:
+            raise ValueError('Records of market {!r} are not '
+                             'contiguous'.format(key))
+        keys.add(key)
+
+
+def _keys(records, columns, starts):
+    keys = records[columns].iloc[starts]
+    if len(columns) == 1:
+        return keys[columns[0]].tolist()
+    return list(keys.itertuples(index=False, name=None))
@@ -0,0 +1,102 @@
+"""
+Multinomial logit (MNL) choice probabilities for many markets at once.
+
+The utility of a product is the dot product of its features and the
+coefficients of the choice model. Within a market, the host's products
+share the host's market share proportionally to the exponentials of their
+utilities, the rest of the market is the 'do not fly' probability. The
+products of all markets are concatenated, the products of market i are at
+offsets[i]:offsets[i + 1], and the results feed directly into
+`mfrm.estimate_class_level_batch`:
+
+>>> probs, nofly_probs = choice_probs(features, coefficients, market_shares,
+...                                   offsets)
+>>> result = estimate_class_level_batch(observed, availability, probs,
+...                                     nofly_probs, offsets)
+"""
+
+import numpy as np
+
+from revpy.helpers import segment_ids, segment_sums
+
+
+def utilities(features, coefficients):
+    """Utilities of products
+
+    Parameters
+    ----------
+    features: 2D np array
+        Features of the products, size n_products*n_features
+    coefficients: np array
+        Coefficient of each feature
+
+    Returns
+    -------
+    np array
+        Utility of each product
+    """
+
+    return np.asarray(features, dtype=float).dot(
+        np.asarray(coefficients, dtype=float))
+
+
+def selection_probs(utilities, market_shares, offsets=None):
+    """Customer selection probabilities of products and 'do not fly'
+    probabilities of markets
+
+    Exponentials of the utilities are shifted by the maximum utility of
+    their market, so that large utilities do not overflow.
+
+    Parameters
+    ----------
+    utilities: np array
+        Utility of each product
+    market_shares: float or np array
+        Host's market share of each market
+    offsets: np array
+        Start of the products of each market followed by the total number
+        of products, by default all products belong to one market
+
+    Returns
+    -------
+    tuple
+        Selection prob of each product and 'do not fly' prob of each market
+    """
+
+    utilities = np.asarray(utilities, dtype=float)
+    if offsets is None:
+        offsets = [0, len(utilities)]
+    offsets = np.asarray(offsets)
+    market_shares = np.broadcast_to(np.asarray(market_shares, dtype=float),
+                                    len(offsets) - 1)
+    markets = segment_ids(offsets)
+
+    exp_utilities = np.exp(utilities - _segment_max(utilities, offsets)[
+        markets])
+    exp_sums = segment_sums(exp_utilities, offsets)
+
+    # empty markets have no products
+    with np.errstate(divide='ignore', invalid='ignore'):
+        probs = exp_utilities * (market_shares / exp_sums)[markets]
+    nofly_probs = 1 - market_shares
+
+    return probs, nofly_probs
+
+
+def choice_probs(features, coefficients, market_shares, offsets=None):
+    """Customer selection probabilities of products and 'do not fly'
+    probabilities of markets from the features of the products, see
+    `utilities` and `selection_probs`."""
+
+    return selection_probs(utilities(features, coefficients), market_shares,
+                           offsets)
+
+
+def _segment_max(values, offsets):
+    """Maximum of each segment of `values`, 0 for empty segments."""
+    maxima = np.zeros(len(offsets) - 1)
+    non_empty = offsets[:-1] < offsets[1:]
+    if np.any(non_empty):
+        maxima[non_empty] = np.maximum.reduceat(values,
+                                                offsets[:-1][non_empty])
+    return maxima
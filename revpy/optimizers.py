@@ -1,7 +1,10 @@
 import numpy as np
 from scipy.stats import norm
 
+from revpy.cache import memoize
 
+
+@memoize
 def calc_EMSRb(fares, demands, sigmas=None):
     """Standard EMSRb algorithm assuming Gaussian distribution of
     demands for the classes.
@@ -29,38 +32,83 @@ def calc_EMSRb(fares, demands, sigmas=None):
     by Talluri et al, see page 48.
 
     """
-    # initialize protection levels y
-    y = np.zeros(len(fares) - 1)
-
     if sigmas is None or np.all(sigmas == 0):
         # 'deterministic EMSRb' if no sigmas provided
         y = demands.cumsum()[:-1]
 
     else:
-        # conventional EMSRb
-        # TODO: vectorize this loop
-        for j in range(1, len(fares)):
-            S_j = demands[:j].sum()
-            # eq. 2.13
-            p_j_bar = np.sum(demands[:j]*fares[:j]) / demands[:j].sum()
-            p_j_plus_1 = fares[j]
-            z_alpha = norm.ppf(1 - p_j_plus_1 / p_j_bar)
-            # sigma of joint distribution
-            sigma = np.sqrt(np.sum(sigmas[:j]**2))
-            # mean of joint distribution.
-            mu = S_j
-            y[j-1] = mu + z_alpha*sigma
-
-        # ensure that protection levels are neither negative (e.g. when
-        # demand is low and sigma is high) nor NaN (e.g. when demand is 0)
-        y[y < 0] = 0
-        y[np.isnan(y)] = 0
-
-        # ensure that protection levels are monotonically increasing.
-        # can be violated when adjusted fares after fare transformation
-        # are not monotonically decreasing
-        # TODO: double-check above reasoning
-        y = np.maximum.accumulate(y)
+        y = stochastic_EMSRb(fares, demands, sigmas)
 
     # protection level for most expensive class should be always 0
     return np.hstack((0, np.round(y)))
+
+
+def calc_EMSRb_batch(fares, demands, sigmas=None):
+    """EMSRb for several flights at once.
+
+    Parameters
+    ----------
+    fares: 2D np array
+           fares, size n_flights*n_classes, each row provided in
+           decreasing order. Flights with less classes are padded with
+           trailing NaN fares.
+    demands: 2D np array
+           demands for the fares in `fares`
+    sigmas: 2D np array
+           standard deviations of demands
+
+    Returns
+    -------
+    2D np array containing the protection levels of each flight, NaN for
+    padded classes
+
+    Each row gives the same protection levels as `calc_EMSRb` applied
+    to the classes of the flight. In particular, flights whose sigmas
+    are all zero are treated deterministically.
+    """
+    padded = np.isnan(fares)
+
+    if sigmas is None:
+        sigmas = np.zeros(fares.shape)
+    deterministic = np.all((sigmas == 0) | padded, axis=1)
+
+    y = demands.cumsum(axis=1)[:, :-1]
+    if not np.all(deterministic):
+        y_stochastic = stochastic_EMSRb(fares, demands, sigmas)
+        y = np.where(deterministic[:, None], y, y_stochastic)
+
+    prot_levels = np.hstack((np.zeros((fares.shape[0], 1)), np.round(y)))
+    prot_levels[padded] = np.nan
+
+    return prot_levels
+
+
+def stochastic_EMSRb(fares, demands, sigmas):
+    """Protection levels y_1, ..., y_{n-1} of conventional EMSRb (without
+    rounding), calculated along the last axis of the inputs.
+    """
+    # all classes j are evaluated at once using cumulative sums over the
+    # classes 1..j
+    with np.errstate(divide='ignore', invalid='ignore'):
+        S = demands.cumsum(axis=-1)[..., :-1]
+        # eq. 2.13
+        p_bar = (demands*fares).cumsum(axis=-1)[..., :-1] / S
+        z_alpha = norm.ppf(1 - fares[..., 1:] / p_bar)
+        # sigma of joint distribution
+        sigma = np.sqrt((sigmas**2).cumsum(axis=-1)[..., :-1])
+        # mean of joint distribution.
+        mu = S
+        y = mu + z_alpha*sigma
+
+    # ensure that protection levels are neither negative (e.g. when
+    # demand is low and sigma is high) nor NaN (e.g. when demand is 0)
+    y[y < 0] = 0
+    y[np.isnan(y)] = 0
+
+    # ensure that protection levels are monotonically increasing.
+    # can be violated when adjusted fares after fare transformation
+    # are not monotonically decreasing
+    # TODO: double-check above reasoning
+    y = np.maximum.accumulate(y, axis=-1)
+
+    return y
@@ -9,12 +9,15 @@ custom heuristic (EMSRb_MR_step).
 import numpy as np
 
 from revpy.helpers import check_fares_decreasing, \
-    cumulative_booking_limits, incremental_booking_limits
-from revpy.optimizers import calc_EMSRb
-from revpy.meta_optimizers import calc_EMSRb_MR
+    check_fares_decreasing_batch, cumulative_booking_limits, \
+    incremental_booking_limits, cumulative_booking_limits_batch, \
+    incremental_booking_limits_batch
+from revpy.optimizers import calc_EMSRb, calc_EMSRb_batch
+from revpy.meta_optimizers import calc_EMSRb_MR, calc_EMSRb_MR_batch
 
 
-def booking_limits(fares, demands, cap, sigmas=None, method='EMSRb'):
+def booking_limits(fares, demands, cap, sigmas=None, method='EMSRb',
+                   validate=True):
     """Calculate bookings limits.
 
     Parameters
@@ -28,6 +31,8 @@ def booking_limits(fares, demands, cap, sigmas=None, method='EMSRb'):
            standard deviations of demands
     method: str
            optimization method ('EMSRb', 'EMSRb_MR' or 'EMSRb_MR_step')
+    validate: bool
+           when False, skip checking that fares are decreasing
 
     Returns
     -------
@@ -36,16 +41,18 @@ def booking_limits(fares, demands, cap, sigmas=None, method='EMSRb'):
     """
     if method == 'EMSRb_MR_step':
         book_lim = iterative_booking_limits(fares, demands, cap, sigmas,
-                                            'EMSRb_MR')
+                                            'EMSRb_MR', validate)
     else:
-        prot_levels = protection_levels(fares, demands, sigmas, cap, method)
+        prot_levels = protection_levels(fares, demands, sigmas, cap, method,
+                                        validate)
         cum_book_lim = cumulative_booking_limits(prot_levels, cap)
         book_lim = incremental_booking_limits(cum_book_lim)
 
     return book_lim
 
 
-def protection_levels(fares, demands, sigmas=None, cap=None, method='EMSRb'):
+def protection_levels(fares, demands, sigmas=None, cap=None, method='EMSRb',
+                      validate=True):
     """Calculate protection levels.
 
     Parameters
@@ -59,27 +66,110 @@ def protection_levels(fares, demands, sigmas=None, cap=None, method='EMSRb'):
            standard deviations of demands
     method: str
            optimization method ('EMSRb'or 'EMSRb_MR')
+    validate: bool
+           when False, skip checking that fares are decreasing
 
     Returns
     -------
     np array of protection levels for each fare class
 
     """
-    check_fares_decreasing(fares)
+    if validate:
+        check_fares_decreasing(fares)
 
     if method == 'EMSRb':
         return calc_EMSRb(fares, demands, sigmas)
 
     elif method == 'EMSRb_MR':
-        prot_levels = calc_EMSRb_MR(fares, demands, sigmas, cap)
+        prot_levels = calc_EMSRb_MR(fares, demands, sigmas, cap,
+                                    validate=False)
         return prot_levels
 
     else:
         raise ValueError('method "{}" not supported'.format(method))
 
 
+def booking_limits_batch(fares, demands, cap, sigmas=None, method='EMSRb',
+                         validate=True):
+    """Calculate bookings limits for several flights at once.
+
+    Parameters
+    ----------
+    fares: 2D np array
+           fares, size n_flights*n_classes, each row provided in
+           decreasing order. Flights with less classes are padded with
+           trailing NaN fares.
+    demands: 2D np array
+           demands for the fares in `fares`
+    cap: np array, capacity of each flight
+    sigmas: 2D np array
+           standard deviations of demands
+    method: str
+           optimization method ('EMSRb' or 'EMSRb_MR')
+    validate: bool
+           when False, skip checking that fares are decreasing
+
+    Returns
+    -------
+    2D np array of booking limits for each flight and fare class, zero
+    for padded classes
+
+    Each row equals the result of `booking_limits` for the corresponding
+    flight.
+    """
+    prot_levels = protection_levels_batch(fares, demands, sigmas, cap, method,
+                                          validate)
+    cum_book_lim = cumulative_booking_limits_batch(prot_levels, cap,
+                                                   ~np.isnan(fares))
+    book_lim = incremental_booking_limits_batch(cum_book_lim)
+
+    return book_lim
+
+
+def protection_levels_batch(fares, demands, sigmas=None, cap=None,
+                            method='EMSRb', validate=True):
+    """Calculate protection levels for several flights at once.
+
+    Parameters
+    ----------
+    fares: 2D np array
+           fares, size n_flights*n_classes, each row provided in
+           decreasing order. Flights with less classes are padded with
+           trailing NaN fares.
+    demands: 2D np array
+           demands for the fares in `fares`
+    sigmas: 2D np array
+           standard deviations of demands
+    cap: np array, capacity of each flight
+    method: str
+           optimization method ('EMSRb' or 'EMSRb_MR')
+    validate: bool
+           when False, skip checking that fares are decreasing
+
+    Returns
+    -------
+    2D np array of protection levels for each flight and fare class, NaN
+    for padded classes
+
+    Invalid rows of `fares` are reported all at once, see
+    `check_fares_decreasing_batch`.
+    """
+    if validate:
+        check_fares_decreasing_batch(fares)
+
+    if method == 'EMSRb':
+        return calc_EMSRb_batch(fares, demands, sigmas)
+
+    elif method == 'EMSRb_MR':
+        return calc_EMSRb_MR_batch(fares, demands, sigmas, cap,
+                                   validate=False)
+
+    else:
+        raise ValueError('method "{}" not supported'.format(method))
+
+
 def iterative_booking_limits(fares, demands, cap, sigmas=None,
-                             method='EMSRb_MR'):
+                             method='EMSRb_MR', validate=True):
     """Custom heuristic for iteratively calculating booking limits.
 
     Parameters
@@ -93,6 +183,8 @@ def iterative_booking_limits(fares, demands, cap, sigmas=None,
            standard deviations of demands
     method: str
            optimization method ('EMSRb'or 'EMSRb_MR')
+    validate: bool
+           when False, skip checking that fares are decreasing
 
     Returns
     -------
@@ -110,20 +202,127 @@ def iterative_booking_limits(fares, demands, cap, sigmas=None,
 
     """
 
-    # iterate through all possible capacities (remaining seats) and
-    # calculate cheapest open fare class (fc)
-    cheapest_open_fc_list = []
-    for remaining_cap in range(1, int(cap) + 1):
-        temp_book_lims = \
-            booking_limits(fares, demands, remaining_cap, sigmas, method)
-        cheapest_open_fc = max(np.where(temp_book_lims > 0)[0])
-        cheapest_open_fc_list.append(cheapest_open_fc)
-    fcs = np.array(range(0, len(fares)))
-    book_lims = np.zeros(len(fcs))
-
-    # count the number of times a particular fare class was the cheapest
-    # open
-    for fc in fcs:
-        book_lims[fc] = cheapest_open_fc_list.count(fc)
-
-    return book_lims
+    if validate:
+        check_fares_decreasing(fares)
+
+    cap = int(cap)
+
+    if np.any(np.diff(fares) == 0):
+        # adjusted fares of tied classes do not depend on capacity and
+        # their protection levels are determined by rounding errors, so
+        # evaluate all capacities at once
+        capacities = np.arange(1, cap + 1)
+        n_caps = len(capacities)
+        temp_book_lims = booking_limits_batch(
+            np.tile(fares, (n_caps, 1)).astype(float),
+            np.tile(demands, (n_caps, 1)),
+            capacities,
+            None if sigmas is None else np.tile(sigmas, (n_caps, 1)),
+            method, validate=False)
+        # cheapest open fare class (fc) for each capacity
+        cheapest_open_fc = \
+            len(fares) - 1 - np.argmax(temp_book_lims[:, ::-1] > 0, axis=1)
+
+        return np.bincount(cheapest_open_fc,
+                           minlength=len(fares)).astype(float)
+
+    # Instead of re-calculating the booking limits for every remaining
+    # capacity, only the capacities where the cheapest open fare class
+    # (fc) changes are searched for. The fare transformation depends on
+    # the capacity only via the cumulative demands capped at capacity, so
+    # the capacity range is split at the cumulative demands. Within each
+    # part, the cheapest open fc is piecewise monotone in the capacity.
+    cum_demands = np.floor(demands.cumsum())
+    breakpoints = np.unique(cum_demands[(cum_demands >= 1) &
+                                        (cum_demands < cap)]).astype(int)
+
+    search = _CheapestOpenClassSearch(fares, demands, sigmas, method)
+    for lower, upper in zip(np.hstack((1, breakpoints + 1)),
+                            np.hstack((breakpoints, cap))):
+        if lower <= upper:
+            search.count(lower, upper)
+
+    # the number of times a particular fare class was the cheapest open
+    return search.counts
+
+
+class _CheapestOpenClassSearch:
+    """Count how often each fare class is the cheapest open class over a
+    range of remaining capacities, evaluating as few capacities as
+    possible.
+
+    For a given remaining capacity, the cheapest open class is the
+    cheapest efficient class whose protection level is below capacity,
+    unless all protection levels are zero (then only the most expensive
+    class is open, see `cumulative_booking_limits`). Between two
+    consecutive cumulative demands, the set of efficient classes changes
+    at most once, the all-zero condition changes at most once, and in
+    between the cheapest open class is non-decreasing in capacity.
+    """
+
+    def __init__(self, fares, demands, sigmas, method):
+        self.fares = fares
+        self.demands = demands
+        self.sigmas = sigmas
+        self.method = method
+        self.counts = np.zeros(len(fares))
+        self._states = {}
+
+    def state(self, remaining_cap):
+        """Return efficient classes, whether all protection levels are
+        zero and the cheapest class with protection level below
+        `remaining_cap`."""
+        if remaining_cap not in self._states:
+            prot_levels = protection_levels(self.fares, self.demands,
+                                            self.sigmas, remaining_cap,
+                                            self.method, validate=False)
+            efficient = ~np.isnan(prot_levels)
+            all_zero = bool(np.all(prot_levels == 0))
+            cheapest_open_fc = \
+                max(np.where(efficient & (prot_levels < remaining_cap))[0])
+            self._states[remaining_cap] = \
+                (efficient.tobytes(), all_zero), cheapest_open_fc
+
+        return self._states[remaining_cap]
+
+    def count(self, lower, upper):
+        """Count cheapest open classes for capacities lower..upper, which
+        must lie between two consecutive cumulative demands."""
+        key_lower, _ = self.state(lower)
+        key_upper, _ = self.state(upper)
+
+        if key_lower != key_upper:
+            # binary search for the first capacity with the same efficient
+            # classes and all-zero condition as `upper`
+            left, right = lower, upper
+            while right - left > 1:
+                middle = (left + right) // 2
+                if self.state(middle)[0] == key_upper:
+                    right = middle
+                else:
+                    left = middle
+            self.count(lower, left)
+            self.count(right, upper)
+
+        elif key_lower[1]:
+            # all protection levels are zero, only class 1 is open
+            self.counts[0] += upper - lower + 1
+
+        else:
+            self._count_monotone(lower, upper)
+
+    def _count_monotone(self, lower, upper):
+        """Bisect capacities lower..upper where the cheapest open class is
+        non-decreasing."""
+        _, fc_lower = self.state(lower)
+        _, fc_upper = self.state(upper)
+
+        if fc_lower == fc_upper:
+            self.counts[fc_lower] += upper - lower + 1
+        elif upper - lower == 1:
+            self.counts[fc_lower] += 1
+            self.counts[fc_upper] += 1
+        else:
+            middle = (lower + upper) // 2
+            self._count_monotone(lower, middle)
+            self._count_monotone(middle + 1, upper)
@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+from revpy.availability import BidPriceAvailability
+
+
+class BidPriceAvailabilityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.A = np.array([[1, 1, 0],
+                           [1, 0, 0],
+                           [0, 1, 0],
+                           [0, 1, 1],
+                           [0, 0, 1]])
+        self.fares = np.array([[800, 500, 580, 350, 120],
+                               [450, 380, 400, 250, 100]], dtype=float)
+        self.bid_prices = [380, 420, 0]
+
+    def test_displacement(self):
+        availability = BidPriceAvailability(sp.csr_matrix(self.A),
+                                            self.bid_prices, self.fares)
+        np.testing.assert_allclose(availability.displacement,
+                                   [800, 380, 420, 420, 0])
+        np.testing.assert_equal(availability.open_products(),
+                                [[True, True, True, False, True],
+                                 [False, True, False, False, True]])
+
+    def test_is_open(self):
+        availability = BidPriceAvailability(self.A, self.bid_prices,
+                                            self.fares)
+
+        np.testing.assert_equal(
+            availability.is_open([0, 0, 3, 1], fares=[800, 799, 500, np.nan]),
+            [True, False, True, False])
+        np.testing.assert_equal(availability.is_open([0, 0, 4], [0, 1, 1]),
+                                [True, False, True])
+
+        with self.assertRaises(ValueError):
+            BidPriceAvailability(self.A, self.bid_prices).is_open([0], [0])
+
+    def test_update_bid_prices(self):
+        availability = BidPriceAvailability(self.A, self.bid_prices,
+                                            self.fares)
+
+        availability.update_bid_prices([100, 50], legs=[2, 0])
+        np.testing.assert_allclose(availability.bid_prices, [50, 420, 100])
+        np.testing.assert_allclose(availability.displacement,
+                                   np.dot(self.A, [50, 420, 100]))
+
+        availability.update_bid_prices([0, 0, 0])
+        np.testing.assert_allclose(availability.displacement, 0)
+        self.assertTrue(availability.open_products().all())
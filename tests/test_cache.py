@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+
+from revpy import cache, helpers, revpy
+from revpy.fare_transformation import calc_fare_transformation
+from revpy.optimizers import calc_EMSRb
+
+
+class CacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fares = np.array([1200, 1000, 800, 600, 400, 200])
+        self.demands = np.array([31.2, 10.9, 14.8, 19.9, 26.9, 36.3])
+        self.sigmas = np.array([11.2, 6.6, 7.7, 8.9, 10.4, 12])
+
+    def tearDown(self):
+        cache.disable_cache()
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(cache.cache_info())
+        p = calc_EMSRb(self.fares, self.demands, self.sigmas)
+        self.assertTrue(p.flags.writeable)
+
+    def test_hits_and_misses(self):
+        cache.enable_cache()
+        p1 = calc_EMSRb(self.fares, self.demands, self.sigmas)
+        p2 = calc_EMSRb(self.fares, self.demands.copy(), sigmas=self.sigmas)
+        calc_EMSRb(self.fares, self.demands + 1, self.sigmas)
+
+        info = cache.cache_info()
+        self.assertEqual((info.hits, info.misses, info.entries), (1, 2, 2))
+        self.assertIs(p1, p2)
+        self.assertEqual([0., 20., 35., 54., 80., 117.], p1.tolist())
+
+    def test_read_only(self):
+        cache.enable_cache()
+        adjusted_fares, _ = calc_fare_transformation(self.fares, self.demands)
+        with self.assertRaises(ValueError):
+            adjusted_fares[0] = 0
+
+    def test_same_booking_limits(self):
+        expected = revpy.booking_limits(self.fares, self.demands, 40,
+                                        self.sigmas, 'EMSRb_MR_step')
+        cache.enable_cache()
+        for _ in range(2):
+            bl = revpy.booking_limits(self.fares, self.demands, 40,
+                                      self.sigmas, 'EMSRb_MR_step')
+            np.testing.assert_equal(bl, expected)
+        self.assertGreater(cache.cache_info().hits, 0)
+
+    def test_trusted_input(self):
+        cache.enable_cache()
+        fares = self.fares[::-1]
+        with helpers.trusted_input():
+            calc_fare_transformation(fares, self.demands)
+
+        with self.assertRaises(ValueError):
+            calc_fare_transformation(fares, self.demands)
+
+    def test_lru_eviction_entries(self):
+        array_cache = cache.ArrayCache(max_entries=2)
+        array_cache.put('a', np.zeros(1))
+        array_cache.put('b', np.zeros(1))
+        array_cache.get('a')
+        array_cache.put('c', np.zeros(1))
+
+        self.assertTrue(array_cache.get('a')[0])
+        self.assertFalse(array_cache.get('b')[0])
+        self.assertEqual(array_cache.info().entries, 2)
+
+    def test_lru_eviction_bytes(self):
+        array_cache = cache.ArrayCache(max_bytes=200)
+        array_cache.put('a', (np.zeros(10), np.zeros(5)))
+        array_cache.put('b', np.zeros(10))
+        self.assertEqual(array_cache.info().bytes, 200)
+
+        array_cache.put('c', np.zeros(1))
+        self.assertFalse(array_cache.get('a')[0])
+        self.assertEqual(array_cache.info().bytes, 88)
+
+        # results larger than the cache are not stored
+        array_cache.put('d', np.zeros(100))
+        self.assertFalse(array_cache.get('d')[0])
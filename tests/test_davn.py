@@ -0,0 +1,70 @@
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+from revpy.davn import davn_booking_limits
+from revpy.revpy import booking_limits
+
+
+class DAVNTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fares = np.array([[800, 500, 580, 350, 120],
+                               [450, 380, 400, 250, 100]], dtype=float)
+        self.demands = np.array([[6, 4, 5, 4, 3],
+                                 [15, 14, 8, 11, 5]], dtype=float)
+        self.cap = np.array([10, 10, 8])
+        self.A = np.array([[1, 1, 0],
+                           [1, 0, 0],
+                           [0, 1, 0],
+                           [0, 1, 1],
+                           [0, 0, 1]])
+
+    def test_adjusted_fares(self):
+        result = davn_booking_limits(self.fares, self.demands, self.cap,
+                                     sp.csr_matrix(self.A))
+
+        np.testing.assert_allclose(result.bid_prices, [380, 420, 0])
+        np.testing.assert_allclose(result.fares[0, :4], [500, 380, 380, 30])
+        np.testing.assert_allclose(result.demands[0, :4], [4, 6, 14, 15])
+        self.assertTrue(np.isnan(result.fares[0, 4:]).all())
+
+        # SFO_BOS in class N is closed on ABE_CLT, its adjusted fare is
+        # 250 - 420
+        on_leg = (result.legs == 2) & (result.products == 8)
+        self.assertEqual(result.virtual_classes[on_leg], [-1])
+
+    def test_leg_booking_limits(self):
+        sigmas = np.sqrt(self.demands)
+        for method in ['EMSRb', 'EMSRb_MR']:
+            result = davn_booking_limits(self.fares, self.demands, self.cap,
+                                         self.A, sigmas=sigmas,
+                                         method=method)
+
+            for leg in range(3):
+                on_leg = (result.legs == leg) & (result.virtual_classes >= 0)
+                products = result.products[on_leg]
+                classes = result.virtual_classes[on_leg]
+                order = np.argsort(classes)
+
+                expected = booking_limits(
+                    result.fares[leg, classes[order]],
+                    self.demands.ravel()[products[order]], self.cap[leg],
+                    sigmas.ravel()[products[order]], method)
+                np.testing.assert_allclose(
+                    result.booking_limits[leg, :len(expected)], expected)
+
+    def test_buckets(self):
+        result = davn_booking_limits(self.fares, self.demands, self.cap,
+                                     self.A, bid_prices=[380, 420, 0],
+                                     buckets=[0, 200, 400, 600])
+
+        np.testing.assert_allclose(result.demands, [[0, 4, 20, 15],
+                                                    [0, 19, 15, 15],
+                                                    [0, 0, 0, 8]])
+        # empty buckets get their lower bound as fare
+        np.testing.assert_allclose(result.fares[:, 0], 600)
+        np.testing.assert_allclose(result.fares[0, 1:], [500, 380, 30])
+        np.testing.assert_allclose(result.booking_limits.sum(axis=1),
+                                   self.cap)
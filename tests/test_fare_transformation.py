@@ -50,3 +50,42 @@ class FareTransformationTest(unittest.TestCase):
         __, __, __, __,  eff_indices = \
             fare_transformation.efficient_strategies(Q, TR, fares[0])
         self.assertEqual(eff_indices.tolist(), [0, 1, 4])
+
+    def test_efficient_strategies_long_ladder(self):
+        # every second class is inefficient
+        fares = np.arange(10000, 5000, -1)
+        demands = np.tile([1, 0], 2500)
+        Q = demands.cumsum()
+        TR = Q*fares
+        __, __, __, __, eff_indices = \
+            fare_transformation.efficient_strategies(Q, TR, fares[0])
+        self.assertEqual(eff_indices.tolist(), list(range(0, 5000, 2)))
+
+    def test_faretrafo_without_fill(self):
+        adjusted_fares, adjusted_demand, eff_indices = \
+            fare_transformation.calc_fare_transformation(
+                self.fares, self.demands, fill_inefficient=False)
+
+        np.testing.assert_almost_equal(adjusted_fares, [1200, 427, 231, 28],
+                                       0)
+        self.assertEqual(eff_indices.tolist(), [0, 1, 2, 3])
+
+    def test_faretrafo_batch(self):
+        fares = np.vstack((self.fares, self.fares, self.fares)).astype(float)
+        fares[2, 3:] = np.nan
+        demands = np.vstack((self.demands, [0, 15, 0, 30, 2, 60],
+                             self.demands))
+        caps = np.array([50, 200, 200])
+        adjusted_fares, adjusted_demand = \
+            fare_transformation.calc_fare_transformation_batch(fares,
+                                                               demands, caps)
+
+        for i, n_classes in enumerate([6, 6, 3]):
+            expected_fares, expected_demand = \
+                fare_transformation.calc_fare_transformation(
+                    fares[i, :n_classes], demands[i, :n_classes], caps[i])
+            np.testing.assert_equal(adjusted_fares[i, :n_classes],
+                                    expected_fares)
+            np.testing.assert_equal(adjusted_demand[i, :n_classes],
+                                    expected_demand)
+        self.assertTrue(np.all(np.isnan(adjusted_fares[2, 3:])))
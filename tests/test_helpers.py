@@ -3,6 +3,7 @@ import unittest
 import numpy as np
 
 from revpy import helpers
+from revpy.exceptions import InvalidFares
 
 
 class HelpersTest(unittest.TestCase):
@@ -20,6 +21,30 @@ class HelpersTest(unittest.TestCase):
         incremental_lim = helpers.incremental_booking_limits(cum_book_lim)
         np.testing.assert_equal(incremental_lim, np.array([30, 0, 10, 0]))
 
+    def test_incremental_booking_limits_batch(self):
+        cum_book_lim = np.array([[40, 10, 10, 0],
+                                 [40, np.nan, 10, np.nan]])
+        incremental_lim = \
+            helpers.incremental_booking_limits_batch(cum_book_lim)
+        np.testing.assert_equal(incremental_lim, np.array([[30, 0, 10, 0],
+                                                           [30, 0, 10, 0]]))
+
+    def test_fill_nan_rows(self):
+        mask = np.array([[True, False, True], [False, True, False]])
+        values = np.array([[10, 100, 1], [20, np.nan, np.nan]])
+        out = helpers.fill_nan_rows(mask, values)
+        np.testing.assert_equal(out, [[10, np.nan, 100],
+                                      [np.nan, 20, np.nan]])
+        np.testing.assert_equal(helpers.compress_rows(out, mask),
+                                [[10, 100, np.nan], [20, np.nan, np.nan]])
+
+    def test_segment_sums(self):
+        values = np.array([1., 2, 3, 4])
+        offsets = [0, 2, 2, 4, 4]
+        np.testing.assert_equal(helpers.segment_sums(values, offsets),
+                                [3, 0, 7, 0])
+        np.testing.assert_equal(helpers.segment_ids(offsets), [0, 0, 2, 2])
+
     def test_cumulative_booking_limits(self):
         pass
 
@@ -31,3 +56,24 @@ class HelpersTest(unittest.TestCase):
         self.assertFalse(helpers.is_decreasing(array1))
         self.assertTrue(helpers.is_decreasing(array2))
         self.assertTrue(helpers.is_decreasing(array3))
+
+    def test_invalid_fare_rows(self):
+        fares = np.array([[3, 2, 1],
+                          [1, 2, 3],
+                          [3, np.nan, np.nan],
+                          [3, np.nan, 1],
+                          [2, 2, np.nan]])
+        self.assertEqual(helpers.invalid_fare_rows(fares).tolist(), [1, 3])
+
+        with self.assertRaises(InvalidFares) as context:
+            helpers.check_fares_decreasing_batch(fares)
+        self.assertEqual(context.exception.rows.tolist(), [1, 3])
+
+    def test_trusted_input(self):
+        fares = np.array([1, 2, 3])
+        with helpers.trusted_input():
+            helpers.check_fares_decreasing(fares)
+            helpers.check_fares_decreasing_batch(fares[None, :])
+
+        with self.assertRaises(ValueError):
+            helpers.check_fares_decreasing(fares)
@@ -0,0 +1,150 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.sparse as sp
+
+from revpy import lp_solve
+from revpy.lp_cache import LPStructureCache, structure_key
+
+
+class LPStructureCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.tmp_dir.name
+
+        self.fares = np.array([[800, 500, 580, 350, 120],
+                               [450, 380, 400, 250, 100]], dtype=float)
+        self.demands = np.array([[6, 4, 5, 4, 3],
+                                 [15, 14, 8, 11, 5]], dtype=float)
+        self.cap = [10, 10, 8]
+        self.A = np.array([[1, 1, 0],
+                           [1, 0, 0],
+                           [0, 1, 0],
+                           [0, 1, 1],
+                           [0, 0, 1]], dtype=float)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_network_lp(self):
+        cache = LPStructureCache(self.directory)
+        expected = lp_solve.solve_network_lp(
+            self.fares.copy(), self.demands.copy(), self.cap, self.A.copy())
+
+        for cached in [False, True]:
+            model = cache.network_lp(self.A, 2)
+            model.update(self.fares, self.demands, self.cap)
+            allocations, bid_prices, revenue = model.solve()
+
+            # the model solves on the cached matrix, memory-mapped on hits
+            if cached:
+                self.assertTrue(is_memory_mapped(model.matrix.data))
+                self.assertFalse(model.matrix.data.flags.writeable)
+
+            np.testing.assert_allclose(allocations, expected[0])
+            np.testing.assert_allclose(bid_prices, expected[1])
+            self.assertAlmostEqual(revenue, expected[2])
+            self.assertEqual(model.product_names[:2], ['trip1_class1',
+                                                       'trip2_class1'])
+
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_load_mmap(self):
+        cache = LPStructureCache(self.directory)
+        structure = cache.get(sp.csr_matrix(self.A), 2,
+                              leg_names=['a', 'b', 'c'])
+        cached = cache.get(sp.csr_matrix(self.A), 2,
+                           leg_names=['a', 'b', 'c'])
+
+        # read-only views of the memory-mapped files
+        self.assertFalse(cached.matrix.data.flags.writeable)
+        np.testing.assert_equal(cached.matrix.toarray(),
+                                structure.matrix.toarray())
+        self.assertEqual(cached.leg_names, ['a', 'b', 'c'])
+        self.assertEqual(cached.product_names, structure.product_names)
+
+    def test_solve_network_lp(self):
+        cache = LPStructureCache(self.directory)
+        for _ in range(2):
+            result = lp_solve.solve_network_lp(
+                self.fares.copy(), self.demands.copy(), self.cap,
+                self.A.copy(), presolve=True, structure_cache=cache)
+            np.testing.assert_allclose(result[1], [380, 420, 0])
+
+    def test_key(self):
+        key = structure_key(self.A, 2)
+
+        self.assertEqual(key, structure_key(self.A.copy(), 2))
+        self.assertNotEqual(key, structure_key(self.A, 3))
+        self.assertNotEqual(key, structure_key(self.A, 2, ['H', 'N']))
+        A = self.A.copy()
+        A[0, 2] = 1
+        self.assertNotEqual(key, structure_key(A, 2))
+
+    def test_key_canonical_csr(self):
+        A = sp.csr_matrix(self.A)
+        key = structure_key(A, 2)
+
+        # the entries of each row reversed and split into two halves
+        indptr = 2 * A.indptr
+        indices = np.empty(2 * A.nnz, dtype=A.indices.dtype)
+        for row in range(A.shape[0]):
+            row_indices = A.indices[A.indptr[row]:A.indptr[row + 1]][::-1]
+            indices[indptr[row]:indptr[row + 1]] = np.tile(row_indices, 2)
+        B = sp.csr_matrix((np.full(2 * A.nnz, 0.5), indices, indptr),
+                          shape=A.shape)
+
+        self.assertEqual(B.nnz, 2 * A.nnz)
+        self.assertEqual(key, structure_key(B, 2))
+        # the hashed matrix is not modified
+        self.assertEqual(B.nnz, 2 * A.nnz)
+
+    def test_evict(self):
+        cache = LPStructureCache(self.directory)
+        cache.get(self.A, 1)
+        entry_size = sum(f.stat().st_size for d in os.scandir(self.directory)
+                         for f in os.scandir(d.path))
+
+        # room for two structures, the least recently used is evicted
+        cache.max_bytes = 2 * entry_size
+        key_1 = structure_key(self.A, 1)
+        cache.get(self.A[::-1], 1)
+        os.utime(os.path.join(self.directory, key_1), (0, 0))
+        os.utime(os.path.join(self.directory,
+                              structure_key(self.A[::-1], 1)), (1, 1))
+        cache.get(self.A[:, ::-1], 1)
+
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        self.assertNotIn(key_1, os.listdir(self.directory))
+
+    def test_foreign_files(self):
+        foreign = os.path.join(self.directory, 'foreign')
+        os.makedirs(os.path.join(foreign, 'sub'))
+        with open(os.path.join(foreign, 'data.bin'), 'wb') as f:
+            f.write(bytes(10000))
+
+        cache = LPStructureCache(self.directory, max_bytes=0)
+        key = structure_key(self.A, 1)
+        stale = os.path.join(self.directory, key + '.tmp-' + 32 * 'a')
+        os.makedirs(stale)
+
+        cache.get(self.A, 1)
+        cache.evict()
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted(['foreign', os.path.basename(stale)]))
+
+        cache.get(self.A, 1)
+        cache.clear()
+        self.assertEqual(os.listdir(self.directory), ['foreign'])
+        self.assertTrue(os.path.exists(os.path.join(foreign, 'data.bin')))
+
+
+def is_memory_mapped(array):
+    while array is not None:
+        if isinstance(array, np.memmap):
+            return True
+        array = getattr(array, 'base', None)
+    return False
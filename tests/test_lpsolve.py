@@ -1,9 +1,15 @@
+import inspect
+import os
+import tempfile
 import unittest
+from unittest import mock
 
 import numpy as np
 import pandas as pd
+import scipy.sparse as sp
 
 from revpy import lp_solve
+from revpy.exceptions import LPSolveError
 
 
 class test_lp_sover(unittest.TestCase):
@@ -59,6 +65,316 @@ class test_lp_sover(unittest.TestCase):
         expected_bid_prices = np.array([[ 380], [ 420], [  0]])
         np.testing.assert_allclose(bid_prices.values, expected_bid_prices)
 
+    def test_sparse_incidence_matrix(self):
+        allocations, bid_prices, _, _, _, _, _ = lp_solve.solve_network_lp(
+            self.fares.values.copy(), self.demands.values.copy(), self.cap,
+            sp.csr_matrix(self.incidence_matrix.values))
+
+        np.testing.assert_allclose(allocations.T, [[5, 0], [4, 1], [5, 0],
+                                                   [0, 0], [3, 5]])
+        np.testing.assert_allclose(bid_prices, [380, 420, 0])
+
+    def test_capacity_matrix(self):
+        A = np.array([[1, 0], [1, 1], [0, np.nan]])
+        M = lp_solve.capacity_matrix(A, 2)
+
+        self.assertTrue(sp.isspmatrix_csr(M))
+        self.assertEqual(M.nnz, 6)
+        np.testing.assert_equal(M.toarray(), [[1, 1, 0, 1, 1, 0],
+                                              [0, 1, 0, 0, 1, 0]])
+
+    def test_network_lp_resolve(self):
+        A = self.incidence_matrix.values
+        for backend in ['auto', 'pulp']:
+            model = lp_solve.NetworkLP(A, 2)
+            model.update(self.fares.values, self.demands.values, self.cap)
+            allocations, bid_prices, revenue = model.solve(backend=backend)
+
+            np.testing.assert_allclose(allocations.T, [[5, 0], [4, 1], [5, 0],
+                                                       [0, 0], [3, 5]])
+            np.testing.assert_allclose(bid_prices, [380, 420, 0])
+
+            # re-solve with less capacity and higher fares
+            capacities = [5, 10, 8]
+            fares = self.fares.values * 1.1
+            model.update(fares=fares, capacities=capacities)
+            allocations, bid_prices, revenue = model.solve(backend=backend)
+
+            expected = lp_solve.solve_network_lp(fares.copy(),
+                                                 self.demands.values.copy(),
+                                                 capacities, A.copy())
+            np.testing.assert_allclose(allocations, expected[0])
+            np.testing.assert_allclose(bid_prices, expected[1])
+            self.assertAlmostEqual(revenue, expected[2])
+
+    def test_in_memory_solve(self):
+        # the default backend neither writes files nor starts a solver
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.dict(os.environ, {'TMPDIR': tmp_dir,
+                                             'TMP': tmp_dir}), \
+                mock.patch('subprocess.Popen', side_effect=AssertionError):
+            result = lp_solve.solve_network_lp(
+                self.fares.values.copy(), self.demands.values.copy(),
+                self.cap, self.incidence_matrix.values.copy())
+
+            model = lp_solve.NetworkLP(self.incidence_matrix.values, 2)
+            model.update(self.fares.values, self.demands.values, self.cap)
+            model.solve()
+            model.update(capacities=[5, 10, 8])
+            model.solve()
+
+            self.assertEqual(os.listdir(tmp_dir), [])
+            self.assertIsNone(model.prob)
+
+        np.testing.assert_allclose(result[1], [380, 420, 0])
+
+    def test_default_backend(self):
+        # LPs are solved in-process with HiGHS by default, CBC through
+        # PuLP only with backend='pulp'
+        for function in [lp_solve.solve_network_lp, lp_solve.NetworkLP.solve]:
+            self.assertEqual(
+                inspect.signature(function).parameters['backend'].default,
+                'auto')
+
+        with mock.patch('revpy.lp_solve.linprog',
+                        wraps=lp_solve.linprog) as linprog:
+            lp_solve.solve_network_lp(
+                self.fares.values.copy(), self.demands.values.copy(),
+                self.cap, self.incidence_matrix.values.copy())
+        self.assertEqual(linprog.call_args.kwargs['method'], 'highs')
+
+        self.assertEqual(lp_solve.select_lp_backend(
+            10, lp_solve.AUTO_IPM_MIN_NONZEROS - 1), 'highs')
+        self.assertEqual(lp_solve.select_lp_backend(
+            10, lp_solve.AUTO_IPM_MIN_NONZEROS), 'highs-ipm')
+
+    def test_backends(self):
+        self.assertIn('pulp', lp_solve.lp_backends())
+        self.assertIn('highs', lp_solve.lp_backends())
+
+        for backend in ['pulp', 'highs', 'auto']:
+            allocations, bid_prices, revenue, _, _, _, _ = \
+                lp_solve.solve_network_lp(
+                    self.fares.values.copy(), self.demands.values.copy(),
+                    self.cap, self.incidence_matrix.values.copy(),
+                    backend=backend, threads=1, time_limit=10)
+
+            np.testing.assert_allclose(allocations.T, [[5, 0], [4, 1], [5, 0],
+                                                       [0, 0], [3, 5]])
+            np.testing.assert_allclose(bid_prices, [380, 420, 0])
+            self.assertAlmostEqual(revenue, 10140)
+
+    def test_backend_status(self):
+        for backend in ['pulp', 'highs']:
+            with self.assertRaises(LPSolveError) as context:
+                lp_solve.solve_network_lp(
+                    self.fares.values.copy(), self.demands.values.copy(),
+                    [-1, 10, 8], self.incidence_matrix.values.copy(),
+                    backend=backend)
+            self.assertEqual(context.exception.status, 'infeasible')
+
+        with self.assertRaises(ValueError):
+            lp_solve.solve_network_lp(
+                self.fares.values.copy(), self.demands.values.copy(),
+                self.cap, self.incidence_matrix.values.copy(),
+                backend='unknown')
+
+    def test_solve_network_lps(self):
+        problem = (self.fares.values, self.demands.values, self.cap,
+                   self.incidence_matrix.values)
+        # negative capacities make the LP infeasible
+        infeasible = (self.fares.values, self.demands.values, [-1, 10, 8],
+                      self.incidence_matrix.values)
+
+        for processes in [1, 2]:
+            results, errors = lp_solve.solve_network_lps(
+                [problem, infeasible, problem], processes=processes)
+
+            self.assertEqual(len(results), 3)
+            self.assertIsNone(results[1])
+            self.assertEqual(list(errors.keys()), [1])
+            self.assertEqual(errors[1].status, 'infeasible')
+            for i in [0, 2]:
+                np.testing.assert_allclose(results[i][1], [380, 420, 0])
+
+    def test_randomized_bid_prices(self):
+        args = (self.fares.values, self.demands.values, self.cap,
+                self.incidence_matrix.values)
+
+        # without variance all scenarios equal the deterministic LP
+        result = lp_solve.randomized_bid_prices(
+            *args, n_scenarios=3, distribution='normal',
+            sigmas=np.zeros((2, 5)))
+        np.testing.assert_allclose(result.mean, [380, 420, 0])
+        np.testing.assert_allclose(result.quantiles, [[380, 420, 0]] * 3)
+        np.testing.assert_allclose(result.revenues, [10140] * 3)
+
+        result = lp_solve.randomized_bid_prices(*args, n_scenarios=20,
+                                                quantiles=[0, 1], seed=1)
+        self.assertEqual(result.bid_prices.shape, (20, 3))
+        np.testing.assert_allclose(result.mean,
+                                   result.bid_prices.mean(axis=0))
+        np.testing.assert_allclose(result.quantiles,
+                                   [result.bid_prices.min(axis=0),
+                                    result.bid_prices.max(axis=0)])
+
+        parallel = lp_solve.randomized_bid_prices(
+            *args, n_scenarios=20, quantiles=[0, 1], seed=1, processes=2)
+        np.testing.assert_allclose(parallel.bid_prices, result.bid_prices)
+
+    def test_bid_price_table(self):
+        args = (self.fares.values, self.demands.values, self.cap,
+                self.incidence_matrix.values)
+
+        table = lp_solve.bid_price_table(*args, leg=0)
+        np.testing.assert_allclose(table.capacities, [4, 9, 10])
+        np.testing.assert_allclose(table.bid_prices, [500, 400, 380])
+        np.testing.assert_allclose(
+            lp_solve.lookup_bid_prices(table, [0, 4, 4.5, 9, 10, 12]),
+            [500, 500, 400, 400, 380, 380])
+
+        # breakpoints between the grid points are found exactly
+        demands = self.demands.values * 0.73
+        refined = lp_solve.bid_price_table(
+            self.fares.values, demands, self.cap, self.incidence_matrix.values,
+            leg=0, capacity_grid=[0, 5, 10, 20], refine=True,
+            backend='highs')
+        np.testing.assert_allclose(refined.capacities,
+                                   [2.92, 3.43, 7.3, 17.52, 19.49, 20])
+        np.testing.assert_allclose(refined.bid_prices,
+                                   [500, 450, 400, 380, 50, 0])
+
+        # revenue at the capacities is the integral of the bid prices
+        revenue = lp_solve.solve_network_lp(
+            self.fares.values.copy(), demands, [0, 10, 8],
+            self.incidence_matrix.values.copy())[2]
+        np.testing.assert_allclose(
+            revenue + np.sum(np.diff(refined.capacities, prepend=0) *
+                             refined.bid_prices),
+            lp_solve.solve_network_lp(
+                self.fares.values.copy(), demands, [20, 10, 8],
+                self.incidence_matrix.values.copy())[2])
+
+    def test_bid_price_table_segments(self):
+        # random network with integer demands, the bid prices of a leg are
+        # constant over several capacities
+        rng = np.random.RandomState(3)
+        A = np.zeros((200, 30))
+        for trip in range(200):
+            A[trip, rng.choice(30, rng.randint(1, 4), replace=False)] = 1
+        fares = np.sort(rng.uniform(50, 500, (3, 200)) * A.sum(axis=1),
+                        axis=0)[::-1]
+        demands = rng.randint(0, 4, (3, 200)).astype(float)
+        cap = np.full(30, 20.)
+
+        revenues = [lp_solve.solve_network_lp(
+            fares.copy(), demands.copy(), np.hstack(([c], cap[1:])),
+            A.copy())[2] for c in range(21)]
+
+        table = lp_solve.bid_price_table(fares, demands, cap, A, leg=0)
+        pulp_table = lp_solve.bid_price_table(fares, demands, cap, A, leg=0,
+                                              backend='pulp')
+
+        for t, rtol in [(table, 1e-9), (pulp_table, 1e-6)]:
+            np.testing.assert_allclose(
+                lp_solve.lookup_bid_prices(t, np.arange(1, 21)),
+                np.diff(revenues), rtol=rtol)
+            # adjacent segments have different bid prices
+            self.assertTrue(np.all(np.abs(np.diff(t.bid_prices)) >
+                                   1e-6 * t.bid_prices[1:]))
+
+        # solver noise does not split segments, the shadow prices at
+        # capacity 0 are degenerate
+        np.testing.assert_equal(
+            pulp_table.capacities[pulp_table.capacities >= 1],
+            table.capacities[table.capacities >= 1])
+        self.assertEqual(len(table.capacities), 19)
+
+    def test_greedy(self):
+        args = (self.fares.values, self.demands.values, self.cap,
+                self.incidence_matrix.values)
+        optimal_revenue = lp_solve.solve_network_lp(
+            *(arg.copy() for arg in args[:2]), self.cap, args[3].copy())[2]
+
+        result = lp_solve.solve_network_greedy(*args)
+        allocations, revenue, upper_bound, gap = (result[0], result[2],
+                                                  result[7], result[8])
+        self.assertEqual(len(result), 9)
+        self.assertEqual(result[3:7], (['trip1', 'trip2', 'trip3', 'trip4',
+                                        'trip5'],
+                                       ['cap_leg1', 'cap_leg2', 'cap_leg3'],
+                                       ['class1', 'class2'],
+                                       ['leg1', 'leg2', 'leg3']))
+        self.assertTrue(np.all(allocations <= self.demands.values))
+        self.assertTrue(np.all(self.incidence_matrix.values.T.dot(
+            allocations.sum(axis=0)) <= self.cap))
+        self.assertLessEqual(revenue, optimal_revenue)
+        self.assertGreaterEqual(upper_bound, optimal_revenue)
+        self.assertAlmostEqual(gap, (upper_bound - revenue) / upper_bound)
+
+        # subgradient steps tighten the bound to the LP optimum
+        result = lp_solve.solve_network_greedy(*args, subgradient_steps=10)
+        self.assertLessEqual(result[7], upper_bound)
+        self.assertAlmostEqual(result[7], optimal_revenue)
+        np.testing.assert_allclose(result[1][:2], [380, 420])
+
+    def test_decomposed(self):
+        # two copies of the network, a trip without legs and an unused leg
+        A = self.incidence_matrix.values
+        A = np.block([[A, np.zeros((5, 4))],
+                      [np.zeros((5, 3)), A, np.zeros((5, 1))],
+                      [np.zeros((1, 7))]])
+        fares = np.hstack((self.fares.values, self.fares.values * 0.9,
+                           [[100], [50]]))
+        demands = np.hstack((self.demands.values, self.demands.values,
+                             [[2], [3]]))
+        capacities = self.cap + [12, 4, 8, 5]
+
+        expected = lp_solve.solve_network_lp(fares.copy(), demands.copy(),
+                                             capacities, A.copy())
+        for processes in [1, 2]:
+            result = lp_solve.solve_network_lp_decomposed(
+                fares.copy(), demands.copy(), capacities, A.copy(),
+                processes=processes)
+
+            np.testing.assert_allclose(result[0], expected[0])
+            np.testing.assert_allclose(result[1], expected[1])
+            self.assertAlmostEqual(result[2], expected[2])
+            self.assertEqual(result[3:], expected[3:])
+
+    def test_network_components(self):
+        A = np.array([[1, 0, 0], [0, 1, 0], [1, 0, 0], [0, 0, 0]])
+        trip_labels, leg_labels, n_components = \
+            lp_solve.network_components(A)
+
+        self.assertEqual(n_components, 4)
+        self.assertEqual(trip_labels[0], trip_labels[2])
+        self.assertEqual(trip_labels[0], leg_labels[0])
+        self.assertNotEqual(trip_labels[0], trip_labels[1])
+        self.assertEqual(len(set(trip_labels) | set(leg_labels)), 4)
+
+    def test_presolve(self):
+        fares = self.fares.values.copy()
+        demands = self.demands.values.copy()
+        # no demand for SFO_CLT in class N, no fare for ABE_BOS in class H
+        demands[1, 1] = 0
+        fares[0, 3] = 0
+        capacities = [10, 10, 100]
+
+        expected = lp_solve.solve_network_lp(fares.copy(), demands.copy(),
+                                             capacities,
+                                             self.incidence_matrix.values)
+        result = lp_solve.solve_network_lp(fares.copy(), demands.copy(),
+                                           capacities,
+                                           self.incidence_matrix.values,
+                                           presolve=True)
+
+        self.assertEqual(result[-1], lp_solve.PresolveStats(10, 2, 3, 1))
+        np.testing.assert_allclose(result[0], expected[0])
+        np.testing.assert_allclose(result[1], expected[1])
+        self.assertAlmostEqual(result[2], expected[2])
+        self.assertEqual(result[3:7], expected[3:])
+
     def test_some_nulls(self):
         fares = self.fares
         demands = self.demands
@@ -1,5 +1,7 @@
 import unittest
 
+import numpy as np
+
 from revpy import mfrm
 from revpy.exceptions import InvalidInputParameters
 
@@ -432,6 +434,157 @@ class MFRMTestClass(unittest.TestCase):
 
         self.assertGreater(result['p2']['demand'], result['p1']['demand'])
 
+    def test_calibrate_no_booking_copy(self):
+        estimates = {'p1': {'demand': 2, 'spill': 0, 'recapture': 1},
+                     'p2': {'demand': 0, 'spill': 0, 'recapture': 0}}
+        observed = {'p1': 3}
+        probs = {'p1': 0.3, 'p2': 0.3}
+
+        result = mfrm.calibrate_no_booking(estimates, observed, {}, probs, 10)
+        self.assertEqual(result['p2']['demand'], 10)
+        self.assertEqual(estimates['p2']['demand'], 0)
+
+        result = mfrm.calibrate_no_booking(estimates, observed, {}, probs, 10,
+                                           copy=False)
+        self.assertIs(result, estimates)
+        self.assertEqual(estimates['p2']['spill'], 10)
+        self.assertEqual(estimates['p1']['demand'], 2)
+
+        # no weights, nothing to distribute the spill to
+        result = mfrm.calibrate_no_booking(estimates, observed, {'p2': 1},
+                                           probs, 20)
+        self.assertEqual(result['p2']['spill'], 10)
+
+
+class MFRMTestArrays(unittest.TestCase):
+
+    def setUp(self):
+        # example 3 from the MFRM paper
+        self.observed = np.array([2, 5, 0, 4, 0, 0, 0, 3, 6])
+        self.availability = np.array([1, 1, 0.25, 1, 0.5, 0, 1, 1, 0.5])
+        self.probs = np.array([0.0256, 0.0513, 0.0769, 0.041, 0.0615,
+                               0.0821, 0.0154, 0.0205, 0.0256])
+        self.nofly_prob = 0.6
+
+    def test_host_level(self):
+        estimations = mfrm.estimate_host_level_arrays(
+            self.observed, self.availability, self.probs, self.nofly_prob)
+        self.assertTupleEqual(round_tuple(estimations), (30.16, 13.83, 3.67))
+
+    def test_class_level(self):
+        estimates = mfrm.estimate_class_level_arrays(
+            self.observed, self.availability, self.probs, self.nofly_prob)
+
+        self.assertIsInstance(estimates, mfrm.ClassLevelEstimates)
+        np.testing.assert_allclose(
+            estimates.demand, [1.63, 4.08, 3.02, 3.27, 1.61, 4.3, 0, 2.45,
+                               9.798], atol=0.005)
+        np.testing.assert_allclose(
+            estimates.spill, [0, 0, 3.02, 0, 1.61, 4.3, 0, 0, 4.899],
+            atol=0.005)
+        np.testing.assert_allclose(
+            estimates.recapture, [0.37, 0.92, 0, 0.73, 0, 0, 0, 0.55, 1.1],
+            atol=0.005)
+
+        products = ['p{}'.format(i) for i in range(9)]
+        expected = mfrm.estimate_class_level(
+            dict(zip(products, self.observed)),
+            dict(zip(products, self.availability)),
+            dict(zip(products, self.probs)), self.nofly_prob)
+        for i, product in enumerate(products):
+            self.assertAlmostEqual(expected[product]['demand'],
+                                   estimates.demand[i])
+
+    def test_class_level_uncalibrated(self):
+        estimates = mfrm.estimate_class_level_arrays(
+            self.observed, self.availability, self.probs, self.nofly_prob,
+            calibrate=False)
+        np.testing.assert_equal(estimates.demand[self.observed == 0], 0)
+
+    def test_calibrate_no_booking_arrays_in_place(self):
+        estimates = mfrm.estimate_class_level_arrays(
+            self.observed, self.availability, self.probs, self.nofly_prob,
+            calibrate=False)
+        _, host_spill, _ = mfrm.estimate_host_level_arrays(
+            self.observed, self.availability, self.probs, self.nofly_prob)
+
+        copied = mfrm.calibrate_no_booking_arrays(
+            estimates, self.observed, self.availability, self.probs,
+            host_spill)
+        np.testing.assert_equal(estimates.demand[self.observed == 0], 0)
+
+        result = mfrm.calibrate_no_booking_arrays(
+            estimates, self.observed, self.availability, self.probs,
+            host_spill, copy=False)
+        self.assertIs(result.demand, estimates.demand)
+        np.testing.assert_allclose(estimates.demand, copied.demand)
+        self.assertAlmostEqual(estimates.spill.sum(), host_spill)
+
+    def test_demand_mass_balance_c_arrays(self):
+        estimations = mfrm.demand_mass_balance_c(3, np.array([2, 0, 1]),
+                                                 np.array([1, 0, 0.5]), 0.61)
+        np.testing.assert_allclose(estimations,
+                                   [[1.59, 0, 1.59], [0, 0, 0.8],
+                                    [0.41, 0, 0.2]], atol=0.01)
+
+    def test_no_availability(self):
+        with self.assertRaises(InvalidInputParameters):
+            mfrm.estimate_host_level_arrays(np.zeros(2), np.zeros(2),
+                                            np.array([0.2, 0.3]), 0.5)
+
+    def test_class_level_batch(self):
+        # the example, an empty market and the example with two products
+        # dropped
+        keep = [0, 1, 2, 3, 4, 5, 6]
+        observed = np.concatenate([self.observed, self.observed[keep]])
+        availability = np.concatenate([self.availability,
+                                       self.availability[keep]])
+        probs = np.concatenate([self.probs, self.probs[keep]])
+        offsets = [0, 9, 9, 16]
+
+        result = mfrm.estimate_class_level_batch(
+            observed, availability, probs, [0.6, 0.5, 0.7], offsets)
+
+        self.assertEqual(result.errors, {})
+        np.testing.assert_equal(result.host_estimates.demand[1], 0)
+        self.assertAlmostEqual(result.host_estimates.demand[0], 30.16,
+                               places=2)
+        np.testing.assert_allclose(
+            result.estimates.demand[:9], [1.63, 4.08, 3.02, 3.27, 1.61, 4.3,
+                                          0, 2.45, 9.798], atol=0.005)
+
+        # estimates of the dict based implementation preceding the arrays
+        self.assertAlmostEqual(result.host_estimates.demand[2], 15.904,
+                               places=3)
+        np.testing.assert_allclose(
+            result.estimates.demand[9:], [1.7666, 4.4164, 2.0929, 3.5331,
+                                          1.1159, 2.9792, 0], atol=1e-4)
+        np.testing.assert_allclose(
+            result.estimates.spill[9:], [0, 0, 2.0929, 0, 1.1159, 2.9792, 0],
+            atol=1e-4)
+        np.testing.assert_allclose(
+            result.estimates.recapture[9:], [0.2335, 0.5836, 0, 0.4669, 0, 0,
+                                             0], atol=1e-4)
+
+    def test_class_level_batch_errors(self):
+        observed = np.concatenate([self.observed, [1, 0]])
+        availability = np.concatenate([self.availability, [0, 1]])
+        probs = np.concatenate([self.probs, [0.2, 0.3]])
+
+        result = mfrm.estimate_class_level_batch(
+            observed, availability, probs, 0.6, [0, 9, 11])
+
+        self.assertEqual(list(result.errors), [1])
+        self.assertIsInstance(result.errors[1], InvalidInputParameters)
+        self.assertTrue(np.isnan(result.estimates.demand[9:]).all())
+        self.assertTrue(np.isnan(result.host_estimates.demand[1]))
+        self.assertAlmostEqual(result.host_estimates.demand[0], 30.16,
+                               places=2)
+
+        with self.assertRaises(InvalidInputParameters):
+            mfrm.estimate_class_level_arrays(observed[9:], availability[9:],
+                                             probs[9:], 0.6)
+
 
 def round_tuple(tlp, level=2):
     return tuple([round(e, level) for e in tlp])
@@ -0,0 +1,111 @@
+import io
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from revpy import mfrm
+from revpy.exceptions import InvalidInputParameters
+from revpy.mfrm_stream import estimate_class_level_stream, market_chunks
+
+
+class MFRMStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        # example 3 from the MFRM paper and a smaller market
+        self.records = pd.DataFrame({
+            'od': ['AB'] * 9 + ['CD'] * 3,
+            'date': [1] * 9 + [2] * 3,
+            'product': ['p{}'.format(i) for i in range(12)],
+            'observed': [2, 5, 0, 4, 0, 0, 0, 3, 6, 1, 0, 2],
+            'availability': [1, 1, 0.25, 1, 0.5, 0, 1, 1, 0.5, 1, 0.5, 0.8],
+            'prob': [0.0256, 0.0513, 0.0769, 0.041, 0.0615, 0.0821, 0.0154,
+                     0.0205, 0.0256, 0.1, 0.2, 0.05]})
+
+    def csv(self, records=None):
+        records = self.records if records is None else records
+        return io.StringIO(records.to_csv(index=False))
+
+    def test_csv(self):
+        for chunksize in [2, 5, 100]:
+            results = list(estimate_class_level_stream(
+                self.csv(), 0.6, market_columns=['od', 'date'],
+                file_format='csv', chunksize=chunksize))
+
+            self.assertEqual([r.market for r in results],
+                             [('AB', 1), ('CD', 2)])
+            for result, market in zip(results, [slice(0, 9), slice(9, 12)]):
+                records = self.records[market]
+                expected = mfrm.estimate_class_level_arrays(
+                    records.observed, records.availability, records.prob,
+                    0.6)
+
+                self.assertEqual(result.products, records['product'].tolist())
+                self.assertIsNone(result.error)
+                np.testing.assert_allclose(result.estimates.demand,
+                                           expected.demand)
+                np.testing.assert_allclose(result.estimates.spill,
+                                           expected.spill)
+
+        self.assertAlmostEqual(results[0].host_estimates.demand, 30.16,
+                               places=2)
+
+    def test_json(self):
+        records = self.records.assign(nofly=0.6)
+        lines = io.StringIO(records.to_json(orient='records', lines=True))
+        results = list(estimate_class_level_stream(
+            lines, market_columns='od', nofly_column='nofly',
+            file_format='json', chunksize=4))
+
+        self.assertEqual([r.market for r in results], ['AB', 'CD'])
+        self.assertAlmostEqual(results[0].host_estimates.demand, 30.16,
+                               places=2)
+
+    def test_invalid_market(self):
+        self.records.loc[10, 'availability'] = 0
+        self.records.loc[10, 'observed'] = 1
+        results = list(estimate_class_level_stream(
+            self.csv(), 0.6, market_columns='od', file_format='csv'))
+
+        self.assertIsNone(results[0].error)
+        self.assertIsInstance(results[1].error, InvalidInputParameters)
+        self.assertTrue(np.isnan(results[1].estimates.demand).all())
+
+    def test_not_contiguous(self):
+        records = self.records.iloc[[0, 1, 9, 10, 2, 3]]
+
+        # markets completed by the same chunk are always checked
+        with self.assertRaises(ValueError):
+            list(estimate_class_level_stream(
+                self.csv(records), 0.6, market_columns='od',
+                file_format='csv'))
+
+        results = estimate_class_level_stream(
+            self.csv(records), 0.6, market_columns='od', file_format='csv',
+            chunksize=2)
+        self.assertEqual([r.market for r in results], ['AB', 'CD', 'AB'])
+
+        with self.assertRaises(ValueError):
+            list(estimate_class_level_stream(
+                self.csv(records), 0.6, market_columns='od',
+                file_format='csv', chunksize=2, check_contiguous=True))
+
+    def test_market_chunks(self):
+        chunks = list(market_chunks(self.csv(), ['od'], 'csv', chunksize=4))
+        self.assertEqual([len(c) for c in chunks], [9, 3])
+
+    def test_market_larger_than_chunksize(self):
+        records = pd.DataFrame({'od': ['AB'] + ['CD'] * 1000 + ['EF'] * 2,
+                                'product': np.arange(1003)})
+
+        with mock.patch('revpy.mfrm_stream.pd.concat',
+                        wraps=pd.concat) as concat:
+            chunks = list(market_chunks(self.csv(records), ['od'], 'csv',
+                                        chunksize=7))
+
+        self.assertEqual([len(c) for c in chunks], [1, 1000, 2])
+        self.assertEqual(chunks[1]['product'].tolist(),
+                         list(range(1, 1001)))
+        # each market is concatenated once
+        self.assertEqual(concat.call_count, 3)
@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+
+from revpy import mfrm, mnl
+
+
+class MNLTest(unittest.TestCase):
+
+    def setUp(self):
+        self.features = np.array([[1, 0.5], [1, 1], [0, 2],
+                                  [1, 0], [0, 1]])
+        self.coefficients = np.array([-0.4, 0.8])
+        self.offsets = [0, 3, 3, 5]
+        self.market_shares = [0.5, 0.6, 0.7]
+
+    def test_choice_probs(self):
+        probs, nofly_probs = mnl.choice_probs(
+            self.features, self.coefficients, self.market_shares,
+            self.offsets)
+
+        np.testing.assert_allclose(nofly_probs, [0.5, 0.4, 0.3])
+        np.testing.assert_allclose(probs[:3].sum(), 0.5)
+        np.testing.assert_allclose(probs[3:].sum(), 0.7)
+
+        utilities = self.features.dot(self.coefficients)
+        expected, nofly_prob = mfrm.selection_probs(
+            {'p{}'.format(i): u for i, u in enumerate(utilities[3:])}, 0.7)
+        np.testing.assert_allclose(probs[3:], list(expected.values()))
+        self.assertAlmostEqual(nofly_probs[2], nofly_prob)
+
+    def test_large_utilities(self):
+        probs, nofly_probs = mnl.selection_probs([1000, 1000, -1000], 0.5)
+        np.testing.assert_allclose(probs, [0.25, 0.25, 0])
+
+        probs, nofly_prob = mfrm.selection_probs({'a': 800, 'b': 800}, 0.5)
+        self.assertEqual(probs, {'a': 0.25, 'b': 0.25})
+
+    def test_estimate_class_level_batch(self):
+        probs, nofly_probs = mnl.choice_probs(
+            self.features, self.coefficients, self.market_shares,
+            self.offsets)
+        result = mfrm.estimate_class_level_batch(
+            [2, 0, 1, 3, 1], [1, 0.5, 1, 1, 0.5], probs, nofly_probs,
+            self.offsets)
+
+        self.assertEqual(result.errors, {})
+        self.assertEqual(len(result.estimates.demand), 5)
@@ -2,6 +2,8 @@ import unittest
 
 import numpy as np
 
+from scipy.stats import norm
+
 from revpy import optimizers, meta_optimizers
 from revpy.helpers import is_increasing
 
@@ -32,6 +34,24 @@ class OptimizersTest(unittest.TestCase):
         p = optimizers.calc_EMSRb(self.fares, demands, sigmas)
         self.assertEqual([0.0, 31.0, 31.0, 46.0, 66.0, 66.0], p.tolist())
 
+    def test_emsrb_dense_price_ladder(self):
+        # compare with a class-by-class evaluation of eq. 2.13
+        rng = np.random.RandomState(42)
+        fares = np.sort(rng.uniform(10, 500, 300))[::-1]
+        demands = rng.uniform(0, 5, 300)
+        sigmas = rng.uniform(0, 2, 300)
+        p = optimizers.calc_EMSRb(fares, demands, sigmas)
+
+        expected = np.zeros(len(fares) - 1)
+        for j in range(1, len(fares)):
+            p_j_bar = np.sum(demands[:j]*fares[:j]) / demands[:j].sum()
+            z_alpha = norm.ppf(1 - fares[j] / p_j_bar)
+            expected[j-1] = demands[:j].sum() + \
+                z_alpha*np.sqrt(np.sum(sigmas[:j]**2))
+        expected = np.maximum.accumulate(np.maximum(expected, 0))
+
+        np.testing.assert_equal(np.hstack((0, np.round(expected))), p)
+
     def test_emsrbmr_stochastic_demand(self):
         # test example data from above mentioned paper
         p = meta_optimizers.calc_EMSRb_MR(self.fares, self.demands, self.sigmas)
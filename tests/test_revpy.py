@@ -73,3 +73,64 @@ class PyRMTest(unittest.TestCase):
         bl = revpy.booking_limits(self.fares, self.demands, cap=self.cap,
                                  sigmas=self.sigmas, method='EMSRb_MR_step')
         np.testing.assert_equal(bl.sum(), self.cap)
+
+    def test_esmrmb_mr_stepwise_all_capacities(self):
+        # the cheapest open class is not monotone in the remaining capacity
+        # here: class 2 opens for some small capacities only
+        fares = np.array([96.94, 86.48])
+        demands = np.array([4.77, 8.7])
+        sigmas = np.array([8.27, 4.42])
+        cap = 100
+
+        expected = np.zeros(len(fares))
+        for remaining_cap in range(1, cap + 1):
+            bl = revpy.booking_limits(fares, demands, remaining_cap, sigmas,
+                                      'EMSRb_MR')
+            expected[max(np.where(bl > 0)[0])] += 1
+
+        bl = revpy.booking_limits(fares, demands, cap=cap, sigmas=sigmas,
+                                  method='EMSRb_MR_step')
+        np.testing.assert_equal(bl, expected)
+        self.assertTrue(0 < bl[1] < 10)
+
+    def test_booking_limits_batch(self):
+        # second flight has only four classes, padded with NaNs
+        fares = np.vstack((self.fares, self.fares)).astype(float)
+        fares[1, 4:] = np.nan
+        demands = np.vstack((self.demands, self.demands))
+        sigmas = np.vstack((self.sigmas, self.sigmas))
+        caps = np.array([self.cap, 40])
+
+        for method in ['EMSRb', 'EMSRb_MR']:
+            bl = revpy.booking_limits_batch(fares, demands, caps, sigmas,
+                                            method)
+            expected = [revpy.booking_limits(self.fares, self.demands,
+                                             self.cap, self.sigmas, method),
+                        revpy.booking_limits(self.fares[:4],
+                                             self.demands[:4], 40,
+                                             self.sigmas[:4], method)]
+
+            np.testing.assert_equal(bl[0], expected[0])
+            np.testing.assert_equal(bl[1], np.hstack((expected[1], [0, 0])))
+
+    def test_protection_levels_batch_esmrmb_mr(self):
+        fares = np.vstack((self.fares, self.fares))
+        demands = np.vstack((self.demands, np.zeros(self.demands.shape)))
+        sigmas = np.vstack((self.sigmas, self.sigmas))
+        p = revpy.protection_levels_batch(fares, demands, sigmas,
+                                          method='EMSRb_MR')
+        np.testing.assert_equal(p, [[0, 35, 52, 84, np.nan, np.nan],
+                                    [0] + [np.nan]*5])
+
+    def test_booking_limits_batch_not_decreasing(self):
+        fares = np.vstack((self.fares, self.fares[::-1]))
+        demands = np.vstack((self.demands, self.demands))
+        with self.assertRaises(ValueError) as context:
+            revpy.booking_limits_batch(fares, demands, [self.cap, self.cap])
+        self.assertEqual(context.exception.rows.tolist(), [1])
+
+    def test_booking_limits_without_validation(self):
+        with self.assertRaises(ValueError):
+            revpy.booking_limits(self.fares[::-1], self.demands, self.cap)
+        revpy.booking_limits(self.fares[::-1], self.demands, self.cap,
+                             validate=False)